@@ -1,22 +1,197 @@
 import sqlite3
 import json
+import pickle
+import threading
+from contextlib import contextmanager
+from itertools import islice
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
 import logging
 
+import numpy as np
+
+try:
+    import blosc  # optional: compresses embedding blobs
+except ImportError:
+    blosc = None
+
+try:
+    import orjson  # optional: ~3-5x faster preference (de)serialization
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+    _json_loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Embedding blobs are raw little-endian float32 bytes, tagged by vec_dtype
+VEC_DTYPE_RAW = "f32"
+VEC_DTYPE_BLOSC = "f32+blosc"
+
+# Bump whenever the DDL in _create_tables changes; warm starts skip the DDL
+SCHEMA_VERSION = 1
+
+# Rows per executemany call during bulk embedding ingest
+EMBEDDING_INSERT_BATCH = 5000
+
+# Prepared-statement cache size; hot-path SQL lives in the constants below so
+# every call hands sqlite3 the same string and hits the cache.
+STATEMENT_CACHE_SIZE = 256
+
+# Seconds a writer waits on another thread's write lock before raising
+BUSY_TIMEOUT = 30
+
+SQL_PAPERS_FOR_DIGEST = """
+SELECT * FROM papers WHERE published_date BETWEEN ? AND ? AND processed = 1 AND summary_generated = 1
+"""
+
+# Parsed papers still waiting for Nikita's summarizer
+SQL_PAPERS_FOR_SUMMARIZATION = """
+SELECT arxiv_id, title, abstract, authors, full_text, sections
+FROM papers WHERE processed = 1 AND summary_generated = 0
+"""
+SQL_COUNT_PAPERS_FOR_SUMMARIZATION = """
+SELECT COUNT(*) FROM papers WHERE processed = 1 AND summary_generated = 0
+"""
+
+SQL_INSERT_PAPER = """
+INSERT INTO papers (arxiv_id, title, abstract, authors, published_date, categories, pdf_url)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(arxiv_id) DO NOTHING
+"""
+
+SQL_INSERT_EMBEDDING = """
+INSERT INTO embeddings (arxiv_id, chunk_index, chunk_text, embedding, chunk_type, vec_dim, vec_dtype)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_SELECT_EMBEDDINGS = """
+SELECT chunk_index, chunk_text, embedding, chunk_type, vec_dtype
+FROM embeddings WHERE arxiv_id = ? ORDER BY chunk_index
+"""
+
+SQL_UPSERT_USER = """
+INSERT INTO users (email, preferences, is_active) 
+VALUES (?, ?, 1)
+ON CONFLICT(email) DO UPDATE SET 
+    preferences = excluded.preferences, 
+    is_active = excluded.is_active
+"""
+
+SQL_ACTIVE_SUBSCRIBERS = "SELECT email, preferences FROM users WHERE is_active = 1"
+
+
+def encode_embedding(vec, compress: bool = False) -> Tuple[bytes, int, str]:
+    """Serialize a vector to (blob, dim, dtype_tag) without pickle."""
+    arr = np.ascontiguousarray(vec, dtype="<f4").ravel()
+    blob = arr.tobytes()
+    if compress and blosc is not None:
+        return blosc.compress(blob, typesize=4, cname="lz4", clevel=3), arr.size, VEC_DTYPE_BLOSC
+    return blob, arr.size, VEC_DTYPE_RAW
+
+
+def decode_embedding(blob: bytes, vec_dtype: Optional[str] = VEC_DTYPE_RAW) -> np.ndarray:
+    """Inverse of encode_embedding; returns a read-only float32 view."""
+    if vec_dtype == VEC_DTYPE_BLOSC:
+        if blosc is None:
+            raise RuntimeError("Embedding is blosc-compressed but blosc is not installed")
+        blob = blosc.decompress(blob)
+    return np.frombuffer(blob, dtype="<f4")
+
+
 class DatabaseManager:
     """Core database manager for all RAG bot data"""
     
-    def __init__(self, db_path="./data/ragbot.db"):
+    def __init__(self, db_path="./data/ragbot.db", compress_embeddings: bool = False):
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
-        self._create_tables()
-        logger.info(f"Database initialized at {db_path}")
+        self.compress_embeddings = compress_embeddings
+        # One connection + cursor per thread (WAL: many readers, one writer).
+        # In-memory databases are per-connection, so those share a single one.
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._shared = self._connect() if db_path == ":memory:" else None
+        if self.cursor.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._create_tables()
+            self.cursor.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        journal_mode = self.cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        logger.info(f"Database initialized at {db_path} (journal_mode={journal_mode})")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a tuned connection and register it for close()."""
+        # Autocommit mode: bulk writes open their own BEGIN IMMEDIATE/COMMIT
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            timeout=BUSY_TIMEOUT,
+        )
+        conn.row_factory = sqlite3.Row
+        self._configure_connection(conn)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _get_conn(self) -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+        """Return this thread's (connection, cursor), opening them on first use."""
+        if self._shared is not None:
+            conn = self._shared
+        else:
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None or cursor.connection is not conn:
+            cursor = self._local.cursor = conn.cursor()
+        return conn, cursor
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self._get_conn()[0]
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        return self._get_conn()[1]
+
+    @contextmanager
+    def read_snapshot(self):
+        """Reads on this thread inside the block all see one consistent snapshot.
+
+        Opens a (deferred) read transaction, so rows committed by other threads
+        meanwhile stay invisible until the block ends.
+        """
+        if self._shared is not None:
+            # One connection shared by every thread: holding a transaction open
+            # here would break the other threads' BEGIN IMMEDIATE writes
+            yield
+            return
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            conn.execute("COMMIT")  # read-only; nothing to roll back
+
+    def _configure_connection(self, conn: sqlite3.Connection):
+        """WAL lets digest reads run alongside pipeline writes; NORMAL sync is safe under WAL."""
+        conn.executescript("""
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-65536;
+        PRAGMA mmap_size=268435456;
+        PRAGMA foreign_keys=ON;
+        """)
     
     def _create_tables(self):
         """Create all necessary tables"""
@@ -48,11 +223,24 @@ class DatabaseManager:
             arxiv_id TEXT NOT NULL,
             chunk_index INTEGER NOT NULL,
             chunk_text TEXT,
-            embedding BLOB,  -- Stored as a pickled NumPy array
+            embedding BLOB,  -- Raw float32 bytes (optionally blosc-compressed)
             chunk_type TEXT, -- e.g., 'intro', 'section_1', 'full_text'
+            vec_dim INTEGER,
+            vec_dtype TEXT DEFAULT 'f32', -- 'f32' or 'f32+blosc'
             FOREIGN KEY (arxiv_id) REFERENCES papers(arxiv_id)
         )
         """)
+        self._add_missing_columns("embeddings", {
+            "vec_dim": "INTEGER",
+            "vec_dtype": "TEXT DEFAULT 'f32'",
+        })
+
+        # Indexes: partial index backs get_papers_for_digest, arxiv_id backs per-paper chunk lookups
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_papers_digest ON papers(published_date)
+        WHERE processed = 1 AND summary_generated = 1
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_arxiv ON embeddings(arxiv_id)")
         
         # Pipeline logs
         self.cursor.execute("""
@@ -79,15 +267,47 @@ class DatabaseManager:
         
         self.conn.commit()
 
+    def _add_missing_columns(self, table: str, columns: Dict[str, str]):
+        """Add columns introduced after a table was first created."""
+        existing = {row['name'] for row in self.cursor.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns.items():
+            if name not in existing:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
     # --- Existing Paper Methods (omitted for brevity, assume they are still here) ---
 
+    @staticmethod
+    def _paper_row(paper_data: Dict) -> Tuple:
+        """Bind tuple for SQL_INSERT_PAPER; list fields are stored as JSON text."""
+        def as_json(value):
+            return value if value is None or isinstance(value, str) else _json_dumps(value)
+        return (
+            paper_data['arxiv_id'],
+            paper_data['title'],
+            paper_data.get('abstract'),
+            as_json(paper_data.get('authors')),
+            paper_data.get('published_date'),
+            as_json(paper_data.get('categories')),
+            paper_data.get('pdf_url'),
+        )
+
     def insert_paper(self, paper_data: Dict) -> None:
         """Insert or ignore a new paper."""
-        try:
-            # ... existing insert logic ...
-            pass
-        except sqlite3.IntegrityError:
+        # ON CONFLICT keeps duplicates off the exception path entirely
+        self.cursor.execute(SQL_INSERT_PAPER, self._paper_row(paper_data))
+        if self.cursor.rowcount == 0:
             logger.info(f"Paper already exists: {paper_data.get('arxiv_id')}")
+
+    def insert_papers(self, papers: Iterable[Dict]) -> int:
+        """Insert many papers in one transaction, skipping ones already stored."""
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.executemany(SQL_INSERT_PAPER, (self._paper_row(p) for p in papers))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return self.cursor.rowcount
     
     def get_paper(self, arxiv_id: str) -> Optional[Dict]:
         """Fetch a single paper by its ID."""
@@ -104,13 +324,111 @@ class DatabaseManager:
         # ... existing get_unprocessed_papers logic ...
         return []
 
+    def iter_papers_for_digest(self, start_date: str, end_date: str) -> Iterator[sqlite3.Row]:
+        """Stream processed papers within a date range as sqlite3.Row objects."""
+        # Own cursor so the stream survives other queries on self.cursor
+        cur = self.conn.execute(SQL_PAPERS_FOR_DIGEST, (start_date, end_date))
+        try:
+            yield from cur
+        finally:
+            cur.close()
+
     def get_papers_for_digest(self, start_date: str, end_date: str) -> List[Dict]:
         """Fetch processed papers within a date range."""
         # This is used by the digest generation
-        self.cursor.execute("""
-        SELECT * FROM papers WHERE published_date BETWEEN ? AND ? AND processed = 1 AND summary_generated = 1
-        """, (start_date, end_date))
-        return [dict(row) for row in self.cursor.fetchall()]
+        return [dict(row) for row in self.iter_papers_for_digest(start_date, end_date)]
+
+    def count_papers_for_summarization(self) -> int:
+        """Number of parsed papers without a summary yet."""
+        return self.cursor.execute(SQL_COUNT_PAPERS_FOR_SUMMARIZATION).fetchone()[0]
+
+    def iter_papers_for_summarization(self) -> Iterator[sqlite3.Row]:
+        """Stream parsed papers without a summary yet, one sqlite3.Row at a time."""
+        # Own cursor so the stream survives other queries on self.cursor
+        cur = self.conn.execute(SQL_PAPERS_FOR_SUMMARIZATION)
+        try:
+            yield from cur
+        finally:
+            cur.close()
+
+    def get_papers_for_summarization(self) -> List[Dict]:
+        """Fetch parsed papers without a summary yet."""
+        return [dict(row) for row in self.iter_papers_for_summarization()]
+
+    # --- Embedding Methods ---
+
+    def insert_embedding(self, arxiv_id: str, chunk_index: int, chunk_text: str,
+                         embedding, chunk_type: str = "full_text") -> None:
+        """Store one chunk embedding as raw float32 bytes."""
+        self.insert_embeddings_bulk(arxiv_id, [{
+            'chunk_index': chunk_index,
+            'chunk_text': chunk_text,
+            'embedding': embedding,
+            'chunk_type': chunk_type,
+        }])
+
+    def insert_embeddings_bulk(self, arxiv_id: str, chunks: Iterable[Dict]) -> int:
+        """
+        Store all chunk embeddings for a paper in one transaction.
+        `chunks` may be a generator of dicts with 'chunk_text', 'embedding' and
+        optional 'chunk_index' / 'chunk_type'; it is consumed in sub-batches.
+        """
+        def rows():
+            for i, chunk in enumerate(chunks):
+                blob, dim, vec_dtype = encode_embedding(chunk['embedding'], self.compress_embeddings)
+                yield (arxiv_id, chunk.get('chunk_index', i), chunk.get('chunk_text'),
+                       blob, chunk.get('chunk_type', 'full_text'), dim, vec_dtype)
+
+        row_iter = rows()
+        inserted = 0
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                batch = list(islice(row_iter, EMBEDDING_INSERT_BATCH))
+                if not batch:
+                    break
+                self.cursor.executemany(SQL_INSERT_EMBEDDING, batch)
+                inserted += len(batch)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return inserted
+
+    def get_embeddings(self, arxiv_id: str) -> List[Dict]:
+        """Fetch all chunk embeddings for a paper, decoded to float32 arrays."""
+        self.cursor.execute(SQL_SELECT_EMBEDDINGS, (arxiv_id,))
+        return [{
+            'chunk_index': row['chunk_index'],
+            'chunk_text': row['chunk_text'],
+            'chunk_type': row['chunk_type'],
+            'embedding': decode_embedding(row['embedding'], row['vec_dtype']),
+        } for row in self.cursor.fetchall()]
+
+    def migrate_pickled_embeddings(self) -> int:
+        """One-time rewrite of legacy pickled-NumPy rows into raw float32 bytes."""
+        self.cursor.execute("SELECT id, embedding FROM embeddings WHERE vec_dim IS NULL")
+        legacy = self.cursor.fetchall()
+        migrated = 0
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for row in legacy:
+                data = row['embedding']
+                # Pickle protocol 2+ starts with PROTO opcode 0x80 and a version byte
+                if not data or data[:1] != b"\x80" or data[1] not in (2, 3, 4, 5):
+                    continue
+                blob, dim, vec_dtype = encode_embedding(pickle.loads(data), self.compress_embeddings)
+                self.cursor.execute(
+                    "UPDATE embeddings SET embedding = ?, vec_dim = ?, vec_dtype = ? WHERE id = ?",
+                    (blob, dim, vec_dtype, row['id']),
+                )
+                migrated += 1
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        logger.info(f"Migrated {migrated} pickled embeddings to raw float32")
+        return migrated
 
     def get_stats(self) -> Dict:
         # ... existing get_stats logic ...
@@ -120,40 +438,69 @@ class DatabaseManager:
 
     def add_or_update_user(self, email: str, preferences: List[str]):
         """Add a new user or update an existing user's preferences."""
-        pref_json = json.dumps(preferences)
-        self.cursor.execute("""
-        INSERT INTO users (email, preferences, is_active) 
-        VALUES (?, ?, 1)
-        ON CONFLICT(email) DO UPDATE SET 
-            preferences = excluded.preferences, 
-            is_active = excluded.is_active
-        """, (email, pref_json))
-        self.conn.commit()
+        self.add_or_update_users([(email, preferences)])
         logger.info(f"User preferences updated for: {email}")
 
+    def add_or_update_users(self, rows: Iterable[Tuple[str, List[str]]]) -> int:
+        """Upsert many (email, preferences) pairs in a single transaction."""
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.executemany(
+                SQL_UPSERT_USER, ((email, _json_dumps(prefs)) for email, prefs in rows)
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return self.cursor.rowcount
+
     def get_all_subscribers(self) -> List[Dict]:
         """Retrieve all active subscribers with their preferences."""
-        self.cursor.execute("SELECT email, preferences FROM users WHERE is_active = 1")
         subscribers = []
-        for row in self.cursor.fetchall():
+        for row in self.cursor.execute(SQL_ACTIVE_SUBSCRIBERS):
             try:
-                preferences = json.loads(row['preferences'])
-            except json.JSONDecodeError:
+                preferences = _json_loads(row['preferences'])
+            except JSONDecodeError:
                 preferences = []
             subscribers.append({'email': row['email'], 'preferences': preferences})
         return subscribers
     
+    def get_subscribers_for_keywords(self, keywords: List[str]) -> List[str]:
+        """Emails of active subscribers whose preferences match any keyword (case-insensitive)."""
+        if not keywords:
+            return []
+        placeholders = ",".join("?" * len(keywords))
+        # Malformed preference JSON is treated as an empty list rather than failing the scan
+        self.cursor.execute(f"""
+        SELECT DISTINCT u.email
+        FROM users u,
+             json_each(CASE WHEN json_valid(u.preferences) THEN u.preferences ELSE '[]' END) j
+        WHERE u.is_active = 1 AND lower(j.value) IN ({placeholders})
+        """, [k.lower() for k in keywords])
+        return [row['email'] for row in self.cursor]
+
+    def analyze(self):
+        """Refresh planner statistics; run after bulk loads so new indexes get picked."""
+        self.cursor.execute("ANALYZE")
+
     def close(self):
-        """Close database connection."""
-        self.conn.close()
+        """Close every connection opened by this manager."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        self._shared = None
 
 # Example usage (for testing the new table)
 if __name__ == "__main__":
     manager = DatabaseManager()
     
     # 1. Add some mock users
-    manager.add_or_update_user("amaan@example.com", ["RAG", "LLM", "Knowledge Graph"])
-    manager.add_or_update_user("jane.doe@example.com", ["Fine-Tuning", "Transformer"])
+    manager.add_or_update_users([
+        ("amaan@example.com", ["RAG", "LLM", "Knowledge Graph"]),
+        ("jane.doe@example.com", ["Fine-Tuning", "Transformer"]),
+    ])
     
     # 2. Retrieve subscribers
     subscribers = manager.get_all_subscribers()
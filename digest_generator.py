@@ -1,5 +1,7 @@
 import json
-from typing import List, Dict, Any
+import heapq
+from itertools import chain
+from typing import List, Dict, Any, Iterable, Optional
 from datetime import datetime, timedelta
 
 # Mock Keywords (can be loaded from config in a real scenario)
@@ -29,36 +31,44 @@ class EmailDigestBot:
                 
         return parsed_paper
         
-    def _rank_papers(self, papers: List[Dict[str, Any]], preferences: List[str]) -> List[Dict[str, Any]]:
-        """Ranks papers based on keyword matching against user preferences."""
+    def _score_paper(self, paper: Dict[str, Any], preference_set: set) -> Dict[str, Any]:
+        """Parsed copy of `paper` with its keyword-match rank_score."""
+        rank_score = 0
+        parsed_paper = self._parse_paper_json_fields(paper)
+        
+        # Combine relevant fields for scoring
+        text_to_score = f"{parsed_paper.get('title', '')} {parsed_paper.get('abstract', '')}"
+        summary = parsed_paper.get('summary', {})
+        for value in summary.values():
+             if isinstance(value, str):
+                text_to_score += f" {value}"
+        
+        # Check for preference keywords in the text
+        for pref in preference_set:
+            if pref in text_to_score.lower():
+                rank_score += 1
+        
+        parsed_paper['rank_score'] = rank_score
+        return parsed_paper
+
+    def _rank_papers(self, papers: Iterable[Dict[str, Any]], preferences: List[str],
+                     limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ranks papers based on keyword matching against user preferences.
+
+        With `limit`, only the top `limit` papers are kept while `papers` is
+        consumed, so a row iterator is never held in memory as a whole.
+        """
         if not papers: return []
             
-        ranked_papers = []
         # Convert preferences to a case-insensitive set for quick lookup
         preference_set = {p.lower() for p in preferences}
-        
-        for paper in papers:
-            rank_score = 0
-            parsed_paper = self._parse_paper_json_fields(paper)
-            
-            # Combine relevant fields for scoring
-            text_to_score = f"{parsed_paper.get('title', '')} {parsed_paper.get('abstract', '')}"
-            summary = parsed_paper.get('summary', {})
-            for value in summary.values():
-                 if isinstance(value, str):
-                    text_to_score += f" {value}"
-            
-            # Check for preference keywords in the text
-            for pref in preference_set:
-                if pref in text_to_score.lower():
-                    rank_score += 1
-            
-            parsed_paper['rank_score'] = rank_score
-            ranked_papers.append(parsed_paper)
+        scored = (self._score_paper(paper, preference_set) for paper in papers)
+        rank_key = lambda x: x.get('rank_score', 0)
 
-        # Sort by rank score (descending)
-        ranked_papers.sort(key=lambda x: x.get('rank_score', 0), reverse=True)
-        return ranked_papers
+        # Sort by rank score (descending); nlargest keeps the same stable order
+        if limit is not None:
+            return heapq.nlargest(limit, scored, key=rank_key)
+        return sorted(scored, key=rank_key, reverse=True)
 
     def _generate_paper_card_html(self, paper: Dict[str, Any]) -> str:
         """Generates the HTML snippet for a single paper card."""
@@ -139,16 +149,16 @@ class EmailDigestBot:
         end_date_str = today.isoformat()
 
         # 2. Fetch processed papers from the database
-        # Note: This relies on the real DatabaseManager now
-        papers = self.db.get_papers_for_digest(start_date_str, end_date_str)
+        # Note: This relies on the real DatabaseManager now. Rows are streamed
+        # straight into the ranking, which keeps only the top max_papers.
+        papers = self.db.iter_papers_for_digest(start_date_str, end_date_str)
+        first = next(papers, None)
         
-        if not papers:
+        if first is None:
             return self._generate_empty_digest_html()
             
         # 3. Personalize and rank the papers
-        ranked_papers = self._rank_papers(papers, preferences)
-        
-        top_papers = ranked_papers[:max_papers]
+        top_papers = self._rank_papers(chain([first], papers), preferences, limit=max_papers)
         
         # 4. Generate the HTML body
         paper_cards_html = "".join(
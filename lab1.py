@@ -1,6 +1,8 @@
 import os
 import io
+import hashlib
 import streamlit as st
+from utils.pdf_text import fitz_pdf_text
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -8,33 +10,52 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # ---------- helpers --------- 
+PARALLEL_PAGE_THRESHOLD = 32  # below this, worker-process start-up outweighs the win
+
 def read_pdf(file_obj) -> str:
+    """Parsed text of an uploaded PDF, cached on disk by the SHA-256 of its bytes ("" on failure)."""
+    # getbuffer() is a zero-copy view of the upload; bytes are only copied on a cache miss
+    try:
+        with file_obj.getbuffer() as mv:
+            return _parse_pdf_cached(hashlib.sha256(mv).hexdigest(), mv)
+    except ValueError as e:
+        st.error(str(e))
+        return ""
+
+@st.cache_data(persist="disk", max_entries=256, show_spinner=False)
+def _parse_pdf_cached(sha: str, _data) -> str:
+    # `_data` is skipped by Streamlit's hasher; `sha` is the cache key.
+    # Raise on failure: a cached "" would pin this file as unreadable on disk
+    text = read_pdf_raw(_data)
+    if not text:
+        raise ValueError(
+            "Couldn't extract text from this PDF. "
+            "Install PyMuPDF (fitz) or PyPDF2 in your environment and try again."
+        )
+    return text
+
+def read_pdf_raw(data) -> str:
     """
-    Extract text from a PDF using PyMuPDF (fitz) if available,
+    Extract text from a PDF (bytes or memoryview) using PyMuPDF (fitz) if available,
     otherwise fall back to PyPDF2. No hard dependency—imports are inside.
     """
-    data = file_obj.read()  # read bytes once
 
     # Try PyMuPDF (fitz)
     try:
-        import fitz  # PyMuPDF
-        doc = fitz.open(stream=data, filetype="pdf")
-        pages = []
-        for p in doc:
-            pages.append(p.get_text("text"))
-        doc.close()
-        return "\n".join(pages).strip()
+        pdf_bytes = bytes(data)  # fitz needs real bytes; no-op if already bytes
+        return fitz_pdf_text(pdf_bytes, PARALLEL_PAGE_THRESHOLD).strip()
     except Exception:
         pass
 
     # Try PyPDF2
     try:
         from PyPDF2 import PdfReader
-        reader = PdfReader(io.BytesIO(data))
-        pages = []
+        reader = PdfReader(io.BytesIO(data))  # accepts the memoryview directly
+        buf = io.StringIO()
         for page in reader.pages:
-            pages.append(page.extract_text() or "")
-        return "\n".join(pages).strip()
+            buf.write(page.extract_text() or "")
+            buf.write("\n")
+        return buf.getvalue().strip()
     except Exception:
         pass
 
@@ -84,12 +105,8 @@ else:
             st.session_state["document_text"] = document
             st.session_state["document_name"] = uploaded_file.name
         elif file_extension == 'pdf':
-            document = read_pdf(uploaded_file)
+            document = read_pdf(uploaded_file)  # shows its own error on failure
             if not document:
-                st.error(
-                    "Couldn't extract text from this PDF. "
-                    "Install PyMuPDF (fitz) or PyPDF2 in your environment and try again."
-                )
                 clear_doc_state()
             else:
                 st.session_state["document_text"] = document
@@ -1,8 +1,12 @@
 import os
 import io
+import hashlib
+import asyncio
 import streamlit as st
-from typing import Optional
-from openai import OpenAI
+from utils.pdf_text import fitz_pdf_text
+import tiktoken
+from typing import List, Optional
+from openai import AsyncOpenAI, OpenAI
 
 # Optional: load .env for local dev (no-op in prod if .env is absent)
 try:
@@ -12,6 +16,11 @@ except Exception:
     pass
 
 # ---------- helpers ---------
+PARALLEL_PAGE_THRESHOLD = 32  # below this, worker-process start-up outweighs the win
+SUMMARY_CHUNK_TOKENS = 6000    # longer documents are summarized map-reduce style
+SUMMARY_CHUNK_OVERLAP = 200
+SYSTEM_SUMMARIZER = "You are a careful, concise summarizer."
+
 def get_api_key() -> Optional[str]:
     # 1) Prefer env/.env (works locally & in Codespaces)
     key = os.getenv("OPENAI_API_KEY")
@@ -24,42 +33,115 @@ def get_api_key() -> Optional[str]:
         return None
 
 def read_pdf(file_obj) -> str:
+    """Parsed text of an uploaded PDF, cached on disk by the SHA-256 of its bytes ("" on failure)."""
+    # getbuffer() is a zero-copy view of the upload; bytes are only copied on a cache miss
+    try:
+        with file_obj.getbuffer() as mv:
+            return _parse_pdf_cached(hashlib.sha256(mv).hexdigest(), mv)
+    except ValueError as e:
+        st.error(str(e))
+        return ""
+
+@st.cache_data(persist="disk", max_entries=256, show_spinner=False)
+def _parse_pdf_cached(sha: str, _data) -> str:
+    # `_data` is skipped by Streamlit's hasher; `sha` is the cache key.
+    # Raise on failure: a cached "" would pin this file as unreadable on disk
+    text = read_pdf_raw(_data)
+    if not text:
+        raise ValueError(
+            "Couldn't extract text from this PDF. "
+            "Install PyMuPDF (fitz) or PyPDF2 in your environment and try again."
+        )
+    return text
+
+def read_pdf_raw(data) -> str:
     """
-    Extract text from a PDF using PyMuPDF (fitz) if available,
+    Extract text from a PDF (bytes or memoryview) using PyMuPDF (fitz) if available,
     otherwise fall back to PyPDF2. No hard dependency—imports are inside.
     """
-    data = file_obj.read()  # read bytes once
 
     # Try PyMuPDF (fitz)
     try:
-        import fitz  # PyMuPDF
-        doc = fitz.open(stream=data, filetype="pdf")
-        pages = [p.get_text("text") for p in doc]
-        doc.close()
-        return "\n".join(pages).strip()
+        pdf_bytes = bytes(data)  # fitz needs real bytes; no-op if already bytes
+        return fitz_pdf_text(pdf_bytes, PARALLEL_PAGE_THRESHOLD).strip()
     except Exception:
         pass
 
     # Try PyPDF2
     try:
         from PyPDF2 import PdfReader
-        reader = PdfReader(io.BytesIO(data))
-        pages = [(page.extract_text() or "") for page in reader.pages]
-        return "\n".join(pages).strip()
+        reader = PdfReader(io.BytesIO(data))  # accepts the memoryview directly
+        buf = io.StringIO()
+        for page in reader.pages:
+            buf.write(page.extract_text() or "")
+            buf.write("\n")
+        return buf.getvalue().strip()
     except Exception:
         pass
 
     return ""  # if neither works or extraction fails
 
+@st.cache_resource(show_spinner=False)
+def make_validated_client(api_key: str, model: str) -> OpenAI:
+    """
+    Build a client and validate the key with a tiny 'ping'
+    (no max_tokens to avoid 400s on some models). Failures are not cached.
+    """
+    c = OpenAI(api_key=api_key)
+    c.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": "ping"}],
+        temperature=0,
+    )
+    return c
+
 def clear_doc_state():
     for k in ("document_text", "document_name"):
         if k in st.session_state:
             del st.session_state[k]
 
+def _encoding_for(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def split_by_tokens(text: str, model: str, max_tokens: int = SUMMARY_CHUNK_TOKENS,
+                    overlap: int = SUMMARY_CHUNK_OVERLAP) -> List[str]:
+    """Split text into token windows of `max_tokens` that overlap by `overlap` tokens."""
+    enc = _encoding_for(model)
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return [text]
+    step = max_tokens - overlap
+    return [enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens) - overlap, step)]
+
+async def _summarize_chunks(api_key: str, model: str, chunks: List[str]) -> List[str]:
+    """Map step: summarize every chunk concurrently, preserving order."""
+    async with AsyncOpenAI(api_key=api_key) as c:
+        responses = await asyncio.gather(*[
+            c.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_SUMMARIZER},
+                    {"role": "user", "content": (
+                        f"This is part {i + 1} of {len(chunks)} of a longer document. "
+                        "Summarize its key points in plain English; keep names, numbers and conclusions.\n\n"
+                        f"---\nPART:\n{chunk}"
+                    )},
+                ],
+                temperature=0.2,
+            )
+            for i, chunk in enumerate(chunks)
+        ])
+    return [r.choices[0].message.content or "" for r in responses]
+
 def summarize_doc(client: OpenAI, model: str, document_text: str, style: str):
     """
     Call the Chat Completions API to summarize the document using the chosen style.
     `style` is one of: '100_words', 'two_paragraphs', 'five_bullets'
+    Documents over SUMMARY_CHUNK_TOKENS are summarized per chunk in parallel first,
+    then the partial summaries are reduced (and streamed) in the chosen style.
     """
     if style == "100_words":
         instructions = (
@@ -78,8 +160,15 @@ def summarize_doc(client: OpenAI, model: str, document_text: str, style: str):
             "Each bullet should be a single sentence. No intro/outro, no title."
         )
 
+    chunks = split_by_tokens(document_text, model)
+    if len(chunks) > 1:
+        partials = asyncio.run(_summarize_chunks(client.api_key, model, chunks))
+        document_text = "\n\n".join(
+            f"[Part {i + 1} summary]\n{p}" for i, p in enumerate(partials)
+        )
+
     messages = [
-        {"role": "system", "content": "You are a careful, concise summarizer."},
+        {"role": "system", "content": SYSTEM_SUMMARIZER},
         {"role": "user", "content": f"{instructions}\n\n---\nDOCUMENT:\n{document_text}"},
     ]
 
@@ -142,15 +231,9 @@ if not api_key:
     )
     st.stop()
 
-client = OpenAI(api_key=api_key)
-
-# Validate key with a tiny 'ping' (no max_tokens to avoid 400s on some models)
+# Validate once per key; reruns reuse the cached client instead of pinging again
 try:
-    _ = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": "ping"}],
-        temperature=0,
-    )
+    client = make_validated_client(api_key, "gpt-4o-mini")
     st.success("API key loaded and validated ✅")
 except Exception as e:
     st.error("OpenAI error during validation. See details below.")
@@ -172,12 +255,8 @@ if uploaded_file:
         st.session_state["document_text"] = document
         st.session_state["document_name"] = uploaded_file.name
     elif file_extension == "pdf":
-        document = read_pdf(uploaded_file)
+        document = read_pdf(uploaded_file)  # shows its own error on failure
         if not document:
-            st.error(
-                "Couldn't extract text from this PDF. "
-                "Install PyMuPDF (fitz) or PyPDF2 in your environment and try again."
-            )
             clear_doc_state()
         else:
             st.session_state["document_text"] = document
@@ -1,5 +1,7 @@
 # lab3.py
 import os, time, sys, traceback, re
+from collections import deque
+from types import SimpleNamespace
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -27,8 +29,11 @@ SYSTEM_PROMPT = (
 FOLLOW_UP_PROMPT = "Do you want more information?"
 
 # ---- Session State ----
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []  # list[{"role": "...", "content": "..."}]
+if not isinstance(st.session_state.get("chat_history"), deque):
+    # Bounded buffer: appends are O(1) and the oldest messages drop off automatically
+    st.session_state.chat_history = deque(
+        st.session_state.get("chat_history", []), maxlen=BUFFER_EXCHANGES * 2
+    )  # deque[{"role": "...", "content": "..."}]
 if "last_user_question" not in st.session_state:
     st.session_state.last_user_question = None  # track the last topic
 
@@ -38,30 +43,33 @@ for m in st.session_state.chat_history:
         st.markdown(m["content"])
 
 # ---- Intent helpers ----
-GREETING_PAT = re.compile(
-    r"^\s*(hi|hello|hey|howdy|good\s+(morning|afternoon|evening)|"
-    r"(i\s*'?m|i\s*am)\s+\w+|my\s+name\s+is\s+\w+|nice\s+to\s+meet\s+you)\b",
-    re.IGNORECASE
-)
-
-ACK_PAT = re.compile(
-    r"^\s*(thanks|thank you|got it|cool|great|awesome|ok|okay|all good)\b[.! ]*$",
-    re.IGNORECASE
-)
+# One alternation, tried in dispatch priority order (yes > no > greeting > ack);
+# m.lastgroup names the intent, anything unmatched is a topic.
+INTENT_PAT = re.compile(r"""(?ix)
+    ^\s*(?:
+      (?P<yes>(y|yes|yeah|yep|sure|ok|okay|please|more(\s+info)?|tell\s+me\s+more)\.?$) |
+      (?P<no>(n|no|nope|nah|not\s+now|i'?m\s+good)\.?$) |
+      (?P<greet>(hi|hello|hey|howdy|good\s+(morning|afternoon|evening)|
+                 (i\s*'?m|i\s*am)\s+\w+|my\s+name\s+is\s+\w+|nice\s+to\s+meet\s+you)\b) |
+      (?P<ack>(thanks|thank\s+you|got\s+it|cool|great|awesome|ok|okay|all\s+good)\b[.!\ ]*$)
+    )""")
+
+def classify_intent(text: str) -> str:
+    """Return 'yes', 'no', 'greet', 'ack' or 'topic' in a single regex pass."""
+    m = INTENT_PAT.match(text.strip())
+    return m.lastgroup if m else "topic"
 
 def is_greeting(text: str) -> bool:
-    return bool(GREETING_PAT.match(text.strip()))
+    return classify_intent(text) == "greet"
 
 def is_ack(text: str) -> bool:
-    return bool(ACK_PAT.match(text.strip()))
+    return classify_intent(text) == "ack"
 
 def is_yes(text: str) -> bool:
-    t = text.strip().lower()
-    return bool(re.fullmatch(r"(y|yes|yeah|yep|sure|ok|okay|please|more|more info|tell me more)\.?", t))
+    return classify_intent(text) == "yes"
 
 def is_no(text: str) -> bool:
-    t = text.strip().lower()
-    return bool(re.fullmatch(r"(n|no|nope|nah|not now|i'?m good|im good)\.?", t))
+    return classify_intent(text) == "no"
 
 def is_question(text: str) -> bool:
     t = text.strip().lower()
@@ -79,21 +87,22 @@ def is_topic(text: str) -> bool:
     not a greeting, not yes/no, not a quick acknowledgement.
     We treat any non-greeting, non-yes/no, non-ack message as a topic.
     """
-    t = text.strip()
-    if not t:
-        return False
-    if is_greeting(t) or is_yes(t) or is_no(t) or is_ack(t):
+    if not text.strip():
         return False
-    return True  # broad on purpose so we follow up after each topic the user asks
+    return classify_intent(text) == "topic"  # broad on purpose so we follow up after each topic the user asks
 
 # ---- Message building and streaming ----
 def build_payload_messages(pending_user_message: str | None = None):
-    trimmed = st.session_state.chat_history[-(BUFFER_EXCHANGES * 2):]
+    trimmed = list(st.session_state.chat_history)
     messages = [{"role": "system", "content": SYSTEM_PROMPT}] + trimmed
     if pending_user_message is not None:
         messages.append({"role": "user", "content": pending_user_message})
     return messages
 
+def _oneshot(content: str):
+    """Wrap a non-streamed reply in the same chunk shape the stream loop reads."""
+    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
 def generate_response_streaming(messages):
     delays = [0.8, 1.6, 3.2]
     last_err = None
@@ -111,11 +120,7 @@ def generate_response_streaming(messages):
             continue
     try:
         comp = client.chat.completions.create(model=MODEL, messages=messages, stream=False)
-        class OneShot:
-            def __iter__(self_inner):
-                content = comp.choices[0].message.content or ""
-                yield type("Chunk", (), {"choices":[type("Ch", (), {"delta": type("D", (), {"content": content})()})()]})()
-        return OneShot()
+        return _oneshot(comp.choices[0].message.content or "")
     except Exception as e2:
         raise last_err or e2
 
@@ -148,7 +153,8 @@ if prompt := st.chat_input("Say hi or ask a question!"):
     st.session_state.chat_history.append({"role": "user", "content": prompt})
 
     # YES → expand the last topic and re-ask follow-up
-    if is_yes(prompt):
+    intent = classify_intent(prompt)
+    if intent == "yes":
         if st.session_state.last_user_question:
             with st.chat_message("assistant"):
                 expand_instruction = (
@@ -167,14 +173,14 @@ if prompt := st.chat_input("Say hi or ask a question!"):
             st.session_state.chat_history.append({"role": "assistant", "content": msg})
 
     # NO → ask what else to help with (no follow-up)
-    elif is_no(prompt):
+    elif intent == "no":
         with st.chat_message("assistant"):
             msg = "Okay! What can I help you with?"
             st.markdown(msg)
         st.session_state.chat_history.append({"role": "assistant", "content": msg})
 
     # Greeting → friendly welcome (no follow-up)
-    elif is_greeting(prompt):
+    elif intent == "greet":
         st.session_state.last_user_question = None
         with st.chat_message("assistant"):
             msg = "Hi! It’s nice to meet you! How can I help you today?"
@@ -182,7 +188,7 @@ if prompt := st.chat_input("Say hi or ask a question!"):
         st.session_state.chat_history.append({"role": "assistant", "content": msg})
 
     # Acknowledgement → polite close (no follow-up)
-    elif is_ack(prompt):
+    elif intent == "ack":
         with st.chat_message("assistant"):
             msg = "You’re welcome! Want to learn something else?"
             st.markdown(msg)
@@ -199,10 +205,6 @@ if prompt := st.chat_input("Say hi or ask a question!"):
             full = stream_and_render(payload, append_follow_up=True)
         st.session_state.chat_history.append({"role": "assistant", "content": full})
 
-    # Trim to last 20 exchanges (40 messages)
-    if len(st.session_state.chat_history) > BUFFER_EXCHANGES * 2:
-        st.session_state.chat_history = st.session_state.chat_history[-(BUFFER_EXCHANGES * 2):]
-
 
 # Old code
 
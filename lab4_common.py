@@ -0,0 +1,370 @@
+# lab4_common.py — ingest/retrieval helpers shared by the Lab 4 pages
+import os, re, glob, hashlib, tempfile, time
+import asyncio
+import numpy as np
+import streamlit as st
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pypdf import PdfReader
+
+# --- SQLite shim ---
+try:
+    import pysqlite3, sys
+    sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+except Exception:
+    pass
+# -------------------
+
+import chromadb
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+from openai import AsyncOpenAI, OpenAI
+
+# ================================
+# Keys & clients
+# ================================
+OPENAI_KEY = st.secrets.get("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", ""))
+
+@st.cache_resource
+def get_llm_client():
+    return OpenAI(api_key=OPENAI_KEY)
+
+client_llm = get_llm_client()
+
+# ================================
+# Helpers
+# ================================
+def read_pdf_text(path: str) -> str:
+    # pypdf already returns "" for pages without a text layer, so only a
+    # corrupt file raises; that PDF is skipped as a whole
+    try:
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            return "\n".join((p.extract_text() or "") for p in reader.pages).strip()
+    except Exception:
+        return ""
+
+PDF_TEXT_CACHE_DIR = os.path.join(".cache", "pdftext")
+# Worker processes for PDF extraction/chunking; set to 1 on single-CPU hosts
+PDF_WORKERS = int(os.getenv("LAB4_PDF_WORKERS", os.cpu_count() or 1))
+
+def _pdf_text_cache_path(path: str) -> str:
+    stat = os.stat(path)
+    key = hashlib.blake2b(f"{path}:{stat.st_mtime}:{stat.st_size}".encode()).hexdigest()
+    return os.path.join(PDF_TEXT_CACHE_DIR, f"{key}.txt")
+
+def _write_text_atomic(cache_path: str, text: str):
+    # Write to a temp file then rename so a crash never leaves a partial entry
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(cache_path),
+                                     suffix=".tmp", delete=False) as tmp:
+        tmp.write(text)
+    os.replace(tmp.name, cache_path)
+
+def read_pdf_texts(paths, pool=None):
+    """Text of each PDF in paths, cached on disk by (path, mtime, size).
+
+    Cache misses are extracted on pool when one is given."""
+    cache_paths = [_pdf_text_cache_path(p) for p in paths]
+    texts = []
+    for cache_path in cache_paths:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                texts.append(f.read())
+        except FileNotFoundError:
+            texts.append(None)
+    misses = [i for i, t in enumerate(texts) if t is None]
+    mapper = pool.map if pool is not None else map
+    for i, text in zip(misses, mapper(read_pdf_text, [paths[i] for i in misses])):
+        if text:  # a failed parse ("") is retried next time rather than cached
+            _write_text_atomic(cache_paths[i], text)
+        texts[i] = text
+    return texts
+
+# One line's text with surrounding whitespace trimmed; blank lines never match
+_PARA_RE = re.compile(r"\S(?:[^\n]*\S)?")
+
+def chunk_text(text: str, max_chars: int = 1400, overlap: int = 150):
+    """Yield ~max_chars slices of text made of whole lines, each starting
+    with the last `overlap` chars of the previous one. Lines longer than
+    max_chars are split with the same stride. Windows are tracked as offsets
+    into text, so the only strings built are the yielded slices."""
+    stride = max(1, max_chars - overlap)
+    cs = ce = None  # current window is text[cs:ce]
+    for m in _PARA_RE.finditer(text):
+        s, e = m.span()
+        if e - s > max_chars:
+            if cs is not None:
+                yield text[cs:ce]
+            for start in range(s, e - overlap, stride):
+                yield text[start:min(start + max_chars, e)]
+            cs, ce = (e - overlap, e) if overlap > 0 else (None, None)
+            continue
+        if cs is not None and e - cs > max_chars:
+            yield text[cs:ce]
+            tail = ce - overlap
+            cs = tail if overlap > 0 and e - tail <= max_chars else None
+            while cs is not None and text[cs].isspace():
+                cs += 1
+        if cs is None:
+            cs = s
+        ce = e
+    if cs is not None:
+        yield text[cs:ce]
+
+def _chunk_list(text: str):
+    # Generators don't pickle, so pool workers hand back a list
+    return list(chunk_text(text))
+
+SIMHASH_MAX_DISTANCE = 3
+
+def _simhash(text: str) -> int:
+    """64-bit SimHash over 3-word shingles."""
+    words = text.lower().split()
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    votes = [0] * 64
+    for sh in shingles:
+        h = int.from_bytes(hashlib.blake2b(sh.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            votes[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, v in enumerate(votes) if v > 0)
+
+class _NearDupIndex:
+    """Seen SimHashes, bucketed by 16-bit band. Two hashes within
+    SIMHASH_MAX_DISTANCE bits share at least one band, so only those
+    buckets need a Hamming check."""
+
+    def __init__(self):
+        self.bands = {}
+
+    def add_if_new(self, h: int) -> bool:
+        keys = [(b, h >> (16 * b) & 0xFFFF) for b in range(4)]
+        for key in keys:
+            for other in self.bands.get(key, ()):
+                if bin(h ^ other).count("1") <= SIMHASH_MAX_DISTANCE:
+                    return False
+        for key in keys:
+            self.bands.setdefault(key, []).append(h)
+        return True
+
+EMBED_MODEL = "text-embedding-3-small"
+# OpenAI /v1/embeddings per-request limits
+EMBED_BATCH_ITEMS = 2048
+EMBED_BATCH_TOKENS = 300_000
+
+def _embedding_batches(docs):
+    """(start, end) slices of docs that fit one embeddings request.
+    Tokens are estimated at ~3 chars each to stay under the limit."""
+    start, tokens = 0, 0
+    for i, doc in enumerate(docs):
+        est = len(doc) // 3 + 1
+        if i > start and (i - start >= EMBED_BATCH_ITEMS or tokens + est > EMBED_BATCH_TOKENS):
+            yield start, i
+            start, tokens = i, 0
+        tokens += est
+    if start < len(docs):
+        yield start, len(docs)
+
+# Embedding requests in flight at once; gains flatten out past a handful
+EMBED_CONCURRENCY = 4
+
+async def _embed_batches(batches):
+    """Embed every batch concurrently, preserving order."""
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    async with AsyncOpenAI(api_key=OPENAI_KEY, timeout=60) as c:
+        async def one(batch):
+            async with sem:
+                resp = await c.embeddings.create(model=EMBED_MODEL, input=batch)
+            return np.array([e.embedding for e in resp.data], dtype=np.float32)
+        return await asyncio.gather(*[one(b) for b in batches])
+
+def embed_texts(docs) -> np.ndarray:
+    """Embed docs in as few requests as the API allows; rows follow docs."""
+    batches = [docs[start:end] for start, end in _embedding_batches(docs)]
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(asyncio.run(_embed_batches(batches)))
+
+EMB_CACHE_DIR = os.path.join(".cache", "emb")
+
+def embed_texts_cached(docs) -> np.ndarray:
+    """embed_texts, with each vector kept on disk as float16 .npy keyed by
+    blake2b(model, chunk). Only chunks never embedded before hit the API;
+    an unchanged chunk of an edited PDF still comes from disk."""
+    keys = [hashlib.blake2b(f"{EMBED_MODEL}\0{d}".encode(), digest_size=16).hexdigest() for d in docs]
+    paths = [os.path.join(EMB_CACHE_DIR, f"{k}.npy") for k in keys]
+    missing = [i for i, p in enumerate(paths) if not os.path.exists(p)]
+    if missing:
+        fresh = embed_texts([docs[i] for i in missing])
+        os.makedirs(EMB_CACHE_DIR, exist_ok=True)
+        for i, vec in zip(missing, fresh):
+            with tempfile.NamedTemporaryFile(dir=EMB_CACHE_DIR, suffix=".tmp", delete=False) as tmp:
+                np.save(tmp, vec.astype(np.float16))
+            os.replace(tmp.name, paths[i])
+    if not paths:
+        return np.empty((0, 0), dtype=np.float32)
+    # Chroma wants float32; cosine ranking is unaffected by the fp16 round-trip
+    return np.stack([np.load(p, mmap_mode="r") for p in paths]).astype(np.float32)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _embed_query_normalized(text: str) -> list:
+    return client_llm.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding
+
+def embed_query(text: str) -> list:
+    """Query embedding, cached on the normalized text so retyped or
+    re-cased questions skip the API round-trip."""
+    return _embed_query_normalized(" ".join(text.split()).lower())
+
+@st.cache_resource
+def get_client(persist_dir: str = ".chromadb"):
+    # Writes through to disk as it goes; there is no persist() step
+    return chromadb.PersistentClient(path=persist_dir)
+
+# Chunks per upsert; Chroma's throughput plateaus around 100-250. A batch
+# slower than INGEST_SLOW_SECONDS halves the size for the rest of the build.
+INGEST_BATCH = 200
+INGEST_MIN_BATCH = 10
+INGEST_SLOW_SECONDS = 30
+
+# Only applied when the collection is first created. OpenAI embeddings are
+# unit-length, so cosine is the right space; batch_size/sync_threshold
+# defer index persistence instead of rewriting it on every insert.
+HNSW_PARAMS = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 50,
+    "hnsw:batch_size": INGEST_BATCH,
+    "hnsw:sync_threshold": 2000,
+}
+
+def get_collection(client, name: str, api_key: str):
+    # Ingest and queries pass precomputed embeddings; kept as the collection's default
+    embedder = OpenAIEmbeddingFunction(api_key=api_key, model_name=EMBED_MODEL)
+    return client.get_or_create_collection(name=name, embedding_function=embedder, metadata=HNSW_PARAMS)
+
+@st.cache_resource
+def get_collection_cached(name: str):
+    """One collection handle (and embedder) shared across reruns and sessions."""
+    return get_collection(get_client(), name, OPENAI_KEY)
+
+# Applied to Chroma's SQLite connection only for the duration of a build
+INGEST_PRAGMAS = {"journal_mode": "OFF", "synchronous": "OFF",
+                  "temp_store": "MEMORY", "locking_mode": "EXCLUSIVE"}
+
+def _chroma_sqlite_conn(client):
+    # Private Chroma internals; the attribute path moved between releases
+    for path in ("_sysdb._conn_pool", "_server._sysdb._conn_pool", "_producer._conn_pool"):
+        obj = client
+        try:
+            for attr in path.split("."):
+                obj = getattr(obj, attr)
+            return obj.connect()
+        except Exception:
+            continue
+    return None
+
+@contextmanager
+def fast_ingest_pragmas(client):
+    """Trade durability for insert speed while a build runs, then restore.
+    Fine for rebuilds, which can simply be re-run after a crash, but the
+    exclusive lock blocks any other process reading the store meanwhile."""
+    conn = _chroma_sqlite_conn(client)
+    if conn is None:
+        yield
+        return
+    saved = {}
+    try:
+        for name, value in INGEST_PRAGMAS.items():
+            saved[name] = conn.execute(f"PRAGMA {name}").fetchone()[0]
+            conn.execute(f"PRAGMA {name}={value}")
+    except Exception:
+        pass
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            try:
+                conn.execute(f"PRAGMA {name}={value}")
+            except Exception:
+                pass
+
+# IDs per coll.get lookup when checking what is already ingested
+GET_IDS_BATCH = 10_000
+
+def build_collection(pdf_glob: str = "pdfs/*.pdf"):
+    client = get_client()
+    with fast_ingest_pragmas(client):
+        return _build_collection(pdf_glob)
+
+def _build_collection(pdf_glob: str):
+    coll = get_collection_cached("Lab4Collection")
+
+    pdf_paths = sorted(glob.glob(pdf_glob))
+    if PDF_WORKERS > 1 and len(pdf_paths) > 1:
+        # pypdf and the chunker are pure Python, so spread them over processes
+        with ProcessPoolExecutor(max_workers=min(PDF_WORKERS, len(pdf_paths))) as ex:
+            texts = read_pdf_texts(pdf_paths, pool=ex)
+            chunked = list(ex.map(_chunk_list, texts))
+    else:
+        texts = read_pdf_texts(pdf_paths)
+        chunked = map(chunk_text, texts)
+
+    ids, docs, metas = [], [], []
+    seen = _NearDupIndex()
+    for path, text, chunks in zip(pdf_paths, texts, chunked):
+        fname = os.path.basename(path)
+        if not text:
+            # Reported here, not in read_pdf_text, which may run in a worker process
+            st.warning(f"Skipped {fname}: no extractable text.")
+            continue
+        for i, ch in enumerate(chunks):
+            # Skip repeated headers/footers and overlap-only chunks before embedding
+            h = _simhash(ch)
+            if not seen.add_if_new(h):
+                continue
+            ids.append(f"{fname}::chunk-{i}")
+            docs.append(ch)
+            metas.append({"source": fname, "chunk": i, "simhash": f"{h:016x}"})
+    # Only chunks Chroma doesn't already hold get embedded and added
+    existing = set()
+    for start in range(0, len(ids), GET_IDS_BATCH):
+        existing.update(coll.get(ids=ids[start:start + GET_IDS_BATCH], include=[])["ids"])
+    keep = [i for i, x in enumerate(ids) if x not in existing]
+    if not keep:
+        return coll
+    ids = [ids[i] for i in keep]
+    docs = [docs[i] for i in keep]
+    metas = [metas[i] for i in keep]
+
+    # Embed up front so Chroma's upsert is only the disk write
+    vectors = embed_texts_cached(docs)
+    # upsert is idempotent, so an ID that slipped past the check just overwrites
+    progress = st.progress(0.0, text="Writing chunks…")
+    batch, start = INGEST_BATCH, 0
+    while start < len(ids):
+        end = start + batch
+        t0 = time.perf_counter()
+        coll.upsert(ids=ids[start:end], documents=docs[start:end], metadatas=metas[start:end],
+                    embeddings=vectors[start:end].tolist())
+        if time.perf_counter() - t0 > INGEST_SLOW_SECONDS:
+            batch = max(INGEST_MIN_BATCH, batch // 2)
+        start = min(end, len(ids))
+        progress.progress(start / len(ids), text=f"Writing chunks… {start}/{len(ids)}")
+    progress.empty()
+    return coll
+
+def top_k_distinct_sources(coll, query: str, k: int = 3, oversample: int = 4):
+    """Best-matching chunk from each of the top k source files. Over-fetches
+    k*oversample hits in one query so near-duplicate chunks of a single PDF
+    don't crowd out the others."""
+    res = coll.query(query_embeddings=[embed_query(query)], n_results=k * oversample,
+                     include=["documents", "metadatas"])
+    docs, metas = res.get("documents", [[]])[0], res.get("metadatas", [[]])[0]
+    seen, out_docs = set(), []
+    for d, m in zip(docs, metas):
+        if m["source"] not in seen:
+            seen.add(m["source"])
+            out_docs.append(d)
+            if len(out_docs) == k:
+                break
+    return out_docs
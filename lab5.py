@@ -31,9 +31,31 @@ except Exception as e:
 
 
 # --- Weather Function (Lab 5a) ---
+# One pooled connection to the weather API, reused across calls and reruns
+_SESSION = requests.Session()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_weather(location, _api_key):
+    """
+    Raw OpenWeatherMap response for a city, cached for 10 minutes (the API's own
+    update interval). _api_key is left out of the cache key; failures raise and
+    so are never cached.
+    """
+    base_url = "https://api.openweathermap.org/data/2.5/weather"
+    params = {
+        "q": location,
+        "appid": _api_key,
+        "units": "metric"  # Get temperature in Celsius directly
+    }
+    response = _SESSION.get(base_url, params=params, timeout=5)
+    response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+    return response.json()
+
+
 def get_current_weather(location, api_key):
     """
     Fetches current weather information for a given location using the OpenWeatherMap API.
+    Returns a dict; on failure it has a single "error" key.
     """
     if not isinstance(location, str):
         return {"error": "Location must be a string."}
@@ -42,17 +64,8 @@ def get_current_weather(location, api_key):
     if "," in location:
         location = location.split(",")[0].strip()
 
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "q": location,
-        "appid": api_key,
-        "units": "metric"  # Get temperature in Celsius directly
-    }
-
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-        data = response.json()
+        data = _fetch_weather(location, api_key)
 
         # Extract relevant weather data
         weather_info = {
@@ -64,24 +77,27 @@ def get_current_weather(location, api_key):
             "humidity": data["main"]["humidity"],
             "description": data["weather"][0]["description"]
         }
-        return json.dumps(weather_info)
+        return weather_info
 
     except requests.exceptions.HTTPError as http_err:
-        if response.status_code == 404:
-            return json.dumps({"error": f"City '{location}' not found. Please check the spelling."})
-        return json.dumps({"error": f"An HTTP error occurred: {http_err}"})
+        if http_err.response is not None and http_err.response.status_code == 404:
+            return {"error": f"City '{location}' not found. Please check the spelling."}
+        return {"error": f"An HTTP error occurred: {http_err}"}
     except requests.exceptions.RequestException as req_err:
-        return json.dumps({"error": f"A request error occurred: {req_err}"})
+        return {"error": f"A request error occurred: {req_err}"}
     except (KeyError, IndexError) as e:
-        return json.dumps({"error": f"Could not parse weather data. Invalid API response. Details: {e}"})
+        return {"error": f"Could not parse weather data. Invalid API response. Details: {e}"}
     except Exception as e:
-        return json.dumps({"error": f"An unexpected error occurred: {e}"})
+        return {"error": f"An unexpected error occurred: {e}"}
 
 
 # --- Streamlit User Interface ---
-location_input = st.text_input("Enter a city name:", placeholder="e.g., Syracuse, NY or London")
+# A form so typing in the box doesn't rerun the page; only submitting does
+with st.form("suggestion"):
+    location_input = st.text_input("Enter a city name:", placeholder="e.g., Syracuse, NY or London")
+    submitted = st.form_submit_button("Get Suggestion", type="primary")
 
-if st.button("Get Suggestion", type="primary"):
+if submitted:
     if not location_input:
         st.warning("Please enter a city name.", icon="⚠️")
     else:
@@ -130,14 +146,13 @@ if st.button("Get Suggestion", type="primary"):
                     function_to_call = available_functions[function_name]
                     function_args = json.loads(tool_calls[0].function.arguments)
 
-                    # Call the weather function
-                    function_response = function_to_call(
+                    # Call the weather function; it returns a dict, checked here in-process
+                    weather_data = function_to_call(
                         location=function_args.get("location", "Syracuse, NY"),
                         api_key=openweathermap_api_key,
                     )
 
                     # Check if the weather function returned an error
-                    weather_data = json.loads(function_response)
                     if "error" in weather_data:
                          st.error(f"Error fetching weather: {weather_data['error']}", icon="🌦️")
                          st.stop()
@@ -150,7 +165,7 @@ if st.button("Get Suggestion", type="primary"):
                             "tool_call_id": tool_calls[0].id,
                             "role": "tool",
                             "name": function_name,
-                            "content": function_response,
+                            "content": json.dumps(weather_data),
                         }
                     )
 
@@ -190,7 +205,9 @@ if st.button("Get Suggestion", type="primary"):
 st.markdown("---")
 if st.checkbox("Test get_current_weather() function"):
     st.subheader("Function Test")
-    test_location = st.text_input("Enter a location to test:", "Syracuse, NY")
-    if st.button("Run Test"):
+    with st.form("weather_test"):
+        test_location = st.text_input("Enter a location to test:", "Syracuse, NY")
+        run_test = st.form_submit_button("Run Test")
+    if run_test:
         weather_result = get_current_weather(test_location, openweathermap_api_key)
         st.json(weather_result)
@@ -2,24 +2,51 @@ import streamlit as st
 import PyPDF2
 # or if you're using specific classes:
 from PyPDF2 import PdfReader
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI, RateLimitError
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import tiktoken
 import io
+import re
+import json
+import sqlite3
+import asyncio
+import hashlib
+import logging
+from contextlib import closing
+from utils.ttl_cache import TTLCache
+
+from utils.pdf_text import fitz, fitz_pdf_text
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 # Initialize OpenAI client
 @st.cache_resource
 def get_openai_client():
     return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
 
+PARALLEL_PAGE_THRESHOLD = 50  # below this, one process parses the whole filing
+
 def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF file"""
+    """Extract text from uploaded PDF file
+
+    Uses PyMuPDF when installed, splitting long filings into page ranges parsed
+    in parallel worker processes; otherwise falls back to PyPDF2.
+    """
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        if fitz is None:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            text = ""
+            for page in pdf_reader.pages:
+                text += page.extract_text() + "\n"
+            return text
+        
+        return fitz_pdf_text(pdf_file.getvalue(), PARALLEL_PAGE_THRESHOLD)
     except Exception as e:
         st.error(f"Error reading PDF: {str(e)}")
         return None
@@ -29,53 +56,186 @@ def chunk_text(text, chunk_size=1000, overlap=200):
     chunks = []
     start = 0
     text_length = len(text)
+    # Offsets just past every '.' / '\n', found in one vectorized pass over the
+    # code points; each chunk then binary-searches into them
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    bounds = np.flatnonzero((codes == ord('.')) | (codes == ord('\n'))) + 1
     
     while start < text_length:
         end = start + chunk_size
-        chunk = text[start:end]
         
         # Try to break at sentence boundaries
         if end < text_length:
-            last_period = chunk.rfind('.')
-            last_newline = chunk.rfind('\n')
-            break_point = max(last_period, last_newline)
-            
-            if break_point > chunk_size * 0.5:  # Only break if we're past halfway
-                chunk = chunk[:break_point + 1]
-                end = start + break_point + 1
+            j = int(np.searchsorted(bounds, end, side='right')) - 1
+            if j >= 0 and bounds[j] - 1 - start > chunk_size * 0.5:  # Only break if we're past halfway
+                end = int(bounds[j])
         
-        chunks.append(chunk.strip())
+        chunks.append(text[start:end].strip())
         start = end - overlap
     
     return chunks
 
+# 3-small supports shortened vectors; 512 dims keep top-5 recall near full size
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_DIMENSIONS = 512
+
 def get_embedding(text, client):
     """Get embedding for text using OpenAI"""
     try:
         response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text[:8000]  # Limit token length
+            model=EMBED_MODEL,
+            input=text[:8000],  # Limit token length
+            dimensions=EMBED_DIMENSIONS
         )
         return response.data[0].embedding
     except Exception as e:
         st.error(f"Embedding error: {str(e)}")
         return None
 
-def retrieve_relevant_chunks(query, chunks, embeddings, client, top_k=5):
-    """Retrieve most relevant chunks using cosine similarity"""
+# Embedding requests in flight at once, and retries on a 429 before giving up
+EMBED_CONCURRENCY = 5
+EMBED_RETRIES = 5
+
+async def _embed_batch(client, batch, sem):
+    """Embed one batch, backing off exponentially while rate-limited."""
+    async with sem:
+        for attempt in range(EMBED_RETRIES):
+            try:
+                response = await client.embeddings.create(
+                    model=EMBED_MODEL,
+                    input=batch,
+                    dimensions=EMBED_DIMENSIONS
+                )
+                return [d.embedding for d in response.data]
+            except RateLimitError:
+                if attempt == EMBED_RETRIES - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+async def _embed_batches(batches, api_key, on_batch=None):
+    """Embed all batches concurrently; returns per-batch results or exceptions, in order."""
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    done = 0
+    async with AsyncOpenAI(api_key=api_key) as client:
+        async def run(batch):
+            nonlocal done
+            result = await _embed_batch(client, batch, sem)
+            done += len(batch)
+            if on_batch:
+                on_batch(done, sum(map(len, batches)))
+            return result
+        return await asyncio.gather(*[run(b) for b in batches], return_exceptions=True)
+
+def get_embeddings_batch(texts, client, batch_size=96, on_batch=None):
+    """Get embeddings for many texts, batch_size inputs per request, with
+    up to EMBED_CONCURRENCY requests in flight.
+
+    Returns one embedding per text, in order. If a request fails the error is
+    shown and the embeddings before that batch are returned, so they still line
+    up with texts[:len(result)]. on_batch(done, total) is called as batches finish.
+    """
+    # Truncate each input to stay under the per-input token limit
+    batches = [[t[:8000] for t in texts[start:start + batch_size]]
+               for start in range(0, len(texts), batch_size)]
+    embeddings = []
+    for result in asyncio.run(_embed_batches(batches, client.api_key, on_batch)):
+        if isinstance(result, Exception):
+            st.error(f"Embedding error: {str(result)}")
+            break
+        embeddings.extend(result)
+    return embeddings
+
+# On-disk (chunks, embeddings) per PDF so re-uploads skip extraction and embedding
+EMB_CACHE_PATH = ".emb_cache.sqlite"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def _emb_cache_key(pdf_bytes):
+    """Cache key: the PDF's content plus everything that shapes its chunks/vectors"""
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    return f"{digest}:{CHUNK_SIZE}:{CHUNK_OVERLAP}:{EMBED_MODEL}:{EMBED_DIMENSIONS}"
+
+def _emb_cache_conn():
+    conn = sqlite3.connect(EMB_CACHE_PATH)
+    conn.execute("""CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        chunks_blob TEXT NOT NULL,
+        emb_blob BLOB NOT NULL,
+        dim INTEGER NOT NULL
+    )""")
+    return conn
+
+def load_cached_embeddings(key):
+    """(chunks, float32 embedding matrix) for key, or None on a miss"""
+    with closing(_emb_cache_conn()) as conn:
+        row = conn.execute("SELECT chunks_blob, emb_blob, dim FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    chunks_blob, emb_blob, dim = row
+    return json.loads(chunks_blob), np.frombuffer(emb_blob, dtype=np.float32).reshape(-1, dim)
+
+def store_cached_embeddings(key, chunks, embeddings):
+    mat = np.asarray(embeddings, dtype=np.float32)
+    with closing(_emb_cache_conn()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(chunks), mat.tobytes(), mat.shape[1]))
+
+def normalize_embeddings(embeddings):
+    """Stack embeddings into a C-contiguous float32 matrix with unit-length rows"""
+    if len(embeddings) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    emb_mat = np.array(embeddings, dtype=np.float32)  # copy; may be a read-only cache buffer
+    emb_mat /= np.linalg.norm(emb_mat, axis=1, keepdims=True)
+    return emb_mat
+
+def quantize_int8(mat):
+    """Symmetric int8 quantization along the last axis.
+
+    Returns (q8, scale) with mat ≈ q8 * scale[..., None]; one scale per row,
+    or a scalar for a single vector.
+    """
+    if mat.size == 0:
+        return np.empty(mat.shape, dtype=np.int8), np.empty(mat.shape[:-1], dtype=np.float32)
+    scale = np.abs(mat).max(axis=-1) / 127
+    scale = np.where(scale == 0, 1, scale).astype(np.float32)
+    q8 = np.round(mat / np.expand_dims(scale, -1)).astype(np.int8)
+    return q8, scale
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _build_emb_matrix(doc_name, file_hash, n_embeddings, _embeddings):
+    """
+    Normalized, int8-quantized (q8, scale) matrix for a document, memoized on
+    (doc_name, file_hash, n_embeddings) so the same upload is prepared once per
+    server; _embeddings is not hashed, so n_embeddings keeps a partial ingest
+    from being reused for a later complete one
+    """
+    return quantize_int8(normalize_embeddings(_embeddings))
+
+def retrieve_relevant_chunks(query, chunks, emb_q8, emb_scale, client, top_k=5):
+    """Retrieve most relevant chunks using cosine similarity
+
+    emb_q8/emb_scale are int8-quantized unit-length rows (see normalize_embeddings
+    and quantize_int8), so the cosine is one integer matrix-vector product
+    rescaled per row.
+    """
     query_embedding = get_embedding(query, client)
     
     if query_embedding is None:
         return []
     
-    # Calculate cosine similarities
-    query_embedding = np.array(query_embedding).reshape(1, -1)
-    embeddings_array = np.array(embeddings)
+    # Calculate cosine similarities; int32 accumulation can't overflow at 512 dims
+    q = np.asarray(query_embedding, dtype=np.float32)
+    q /= np.linalg.norm(q)
+    q8, q_scale = quantize_int8(q)
     
-    similarities = cosine_similarity(query_embedding, embeddings_array)[0]
+    similarities = (emb_q8.astype(np.int32) @ q8.astype(np.int32)) * (emb_scale * q_scale)
     
-    # Get top-k indices
-    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    # Get top-k indices: select in O(N), then sort only those k
+    k = min(top_k, len(similarities))
+    if k == 0:
+        return []
+    part = np.argpartition(-similarities, k - 1)[:k]
+    top_indices = part[np.argsort(-similarities[part])]
     
     # Return chunks with their similarity scores
     results = []
@@ -88,50 +248,163 @@ def retrieve_relevant_chunks(query, chunks, embeddings, client, top_k=5):
     
     return results
 
-def rerank_chunks(query, retrieved_chunks, client):
-    """Re-rank chunks using LLM-based semantic similarity"""
-    if not retrieved_chunks:
-        return []
+RERANK_CHUNK_TOKENS = 150
+
+@st.cache_resource
+def get_rerank_encoding():
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+def _truncate_tokens(text, max_tokens=RERANK_CHUNK_TOKENS):
+    """First max_tokens tokens of text, as the reranker model counts them"""
+    enc = get_rerank_encoding()
+    tokens = enc.encode(text)
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens])
+
+_SCORE_RE = re.compile(r'\d+(?:\.\d+)?')
+
+@st.cache_resource
+def get_rerank_cache():
+    """Rerank scores shared across reruns, keyed by (query, doc, chunk index)"""
+    return TTLCache(max_items=2048, ttl_sec=900)
+
+def _score_one(query, item, client, doc_name=None):
+    """Ask the LLM for a 0-10 relevance score; falls back to the embedding score"""
+    # Quoted or verbatim queries are literal lookups: the embedding score is enough
+    if query.strip().startswith('"') or query in item['chunk']:
+        return item['similarity'] * 10
     
-    # Use LLM to score relevance
-    reranked = []
+    cache = get_rerank_cache()
+    key = (hash(query), doc_name, item['index'])
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
     
-    for item in retrieved_chunks:
-        prompt = f"""On a scale of 0-10, rate how relevant this text chunk is to answering the query.
+    prompt = f"""On a scale of 0-10, rate how relevant this text chunk is to answering the query.
 Query: {query}
 
-Text Chunk: {item['chunk'][:500]}...
+Text Chunk: {_truncate_tokens(item['chunk'])}...
 
 Respond with ONLY a number between 0-10."""
+    
+    try:
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a relevance scoring assistant. Respond only with a number."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=10
+        )
         
+        score_text = response.choices[0].message.content.strip()
+        # Extract number from response
+        m = _SCORE_RE.search(score_text)
+        if not m:
+            return item['similarity'] * 10
+        score = min(max(float(m.group()), 0), 10)  # Clamp between 0-10
+        cache.set(key, score)
+        return score
+    except:
+        return item['similarity'] * 10  # Fallback to embedding score
+
+def _score_batch(query, items, client):
+    """Score all items in one LLM call; None if the reply isn't one score per item"""
+    numbered = "\n".join(f"{i+1}. {_truncate_tokens(item['chunk'])}" for i, item in enumerate(items))
+    prompt = f"""Rate each text chunk 0-10 for how relevant it is to answering the query.
+Query: {query}
+
+Chunks:
+{numbered}
+
+Reply with a JSON object {{"scores": [...]}} holding exactly {len(items)} numbers, in chunk order."""
+    
+    try:
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a relevance scoring assistant. Respond only with JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        scores = json.loads(response.choices[0].message.content)["scores"]
+        if len(scores) != len(items):
+            return None
+        return [min(max(float(s), 0), 10) for s in scores]  # Clamp between 0-10
+    except:
+        return None
+
+# Rerank calls in flight at once when falling back to one call per chunk
+RERANK_WORKERS = 8
+
+@st.cache_resource
+def get_reranker():
+    """Local cross-encoder reranker, or None when it isn't installed or can't be loaded"""
+    if CrossEncoder is None:
+        return None
+    try:
+        return CrossEncoder('BAAI/bge-reranker-v2-m3', max_length=512)
+    except Exception as e:
+        # Offline with no HF cache, out of memory, ...: use the LLM scorer instead
+        logger.warning(f"Cross-encoder reranker unavailable, using LLM scoring: {e}")
+        return None
+
+def rerank_chunks(query, retrieved_chunks, client, doc_name=None):
+    """Re-rank chunks with a local cross-encoder, or LLM-based scoring without one"""
+    if not retrieved_chunks:
+        return []
+    
+    reranker = get_reranker()
+    if reranker is not None:
+        # One batched forward pass, no API calls; sigmoid scores in [0, 1]
         try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a relevance scoring assistant. Respond only with a number."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=10
-            )
-            
-            score_text = response.choices[0].message.content.strip()
-            # Extract number from response
-            score = float(''.join(filter(lambda x: x.isdigit() or x == '.', score_text)))
-            score = min(max(score, 0), 10)  # Clamp between 0-10
-            
-            item['rerank_score'] = score
-            reranked.append(item)
-        except:
-            item['rerank_score'] = item['similarity'] * 10  # Fallback to embedding score
-            reranked.append(item)
+            scores = reranker.predict([(query, item['chunk'][:500]) for item in retrieved_chunks], batch_size=16)
+        except Exception as e:
+            logger.warning(f"Cross-encoder reranking failed, using LLM scoring: {e}")
+        else:
+            for item, score in zip(retrieved_chunks, scores):
+                item['rerank_score'] = float(score) * 10
+            return sorted(retrieved_chunks, key=lambda x: x['rerank_score'], reverse=True)
+    
+    cache = get_rerank_cache()
+    literal = query.strip().startswith('"')
+    scores = [None] * len(retrieved_chunks)
+    pending = []
+    for i, item in enumerate(retrieved_chunks):
+        if literal or query in item['chunk']:
+            scores[i] = item['similarity'] * 10
+        else:
+            scores[i] = cache.get((hash(query), doc_name, item['index']))
+            if scores[i] is None:
+                pending.append(i)
+    
+    if pending:
+        # Use LLM to score relevance: one prompt for all chunks, or in parallel per chunk
+        batch_scores = _score_batch(query, [retrieved_chunks[i] for i in pending], client)
+        if batch_scores is None:
+            with ThreadPoolExecutor(max_workers=min(RERANK_WORKERS, len(pending))) as ex:
+                batch_scores = list(ex.map(
+                    lambda i: _score_one(query, retrieved_chunks[i], client, doc_name), pending
+                ))
+        else:
+            for i, score in zip(pending, batch_scores):
+                cache.set((hash(query), doc_name, retrieved_chunks[i]['index']), score)
+        for i, score in zip(pending, batch_scores):
+            scores[i] = score
+    
+    reranked = []
+    for item, score in zip(retrieved_chunks, scores):
+        item['rerank_score'] = score
+        reranked.append(item)
     
     # Sort by rerank score
     reranked.sort(key=lambda x: x['rerank_score'], reverse=True)
     return reranked
 
-def generate_answer(query, relevant_chunks, client, company_name):
-    """Generate answer using LLM with retrieved context"""
+def generate_answer_stream(query, relevant_chunks, client, company_name):
+    """Generate answer using LLM with retrieved context, yielding text as it arrives"""
     # Prepare context from chunks
     context = "\n\n---\n\n".join([
         f"[Source {i+1}, Relevance: {chunk['rerank_score']:.2f}/10]\n{chunk['chunk'][:800]}" 
@@ -164,12 +437,15 @@ Answer:"""
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
-            max_tokens=800
+            max_tokens=800,
+            stream=True
         )
         
-        return response.choices[0].message.content
+        for chunk in response:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
     except Exception as e:
-        return f"Error generating answer: {str(e)}"
+        yield f"Error generating answer: {str(e)}"
 
 def main():
     st.set_page_config(page_title="SEC 10-Q RAG Chatbot", page_icon="📊", layout="wide")
@@ -230,32 +506,48 @@ def main():
             
             for uploaded_file in uploaded_files:
                 if uploaded_file.name not in st.session_state.documents:
-                    # Extract text
-                    text = extract_text_from_pdf(uploaded_file)
+                    cache_key = _emb_cache_key(uploaded_file.getvalue())
+                    file_hash = cache_key.split(":", 1)[0]
+                    cached = load_cached_embeddings(cache_key)
                     
-                    if text:
-                        # Chunk text
-                        chunks = chunk_text(text, chunk_size=1000, overlap=200)
-                        
+                    if cached:
+                        chunks, embeddings = cached
+                    else:
+                        # Extract text
+                        text = extract_text_from_pdf(uploaded_file)
+                        chunks = chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP) if text else []
+                    
+                    if chunks and not cached:
                         # Generate embeddings
-                        embeddings = []
                         progress_bar = st.progress(0)
                         status_text = st.empty()
                         
-                        for i, chunk in enumerate(chunks):
-                            status_text.text(f"Embedding {uploaded_file.name}: {i+1}/{len(chunks)}")
-                            embedding = get_embedding(chunk, client)
-                            if embedding:
-                                embeddings.append(embedding)
-                            progress_bar.progress((i + 1) / len(chunks))
+                        def on_batch(done, total):
+                            status_text.text(f"Embedding {uploaded_file.name}: {done}/{total}")
+                            progress_bar.progress(done / total)
+                        
+                        embeddings = get_embeddings_batch(chunks, client, on_batch=on_batch)
                         
                         progress_bar.empty()
                         status_text.empty()
                         
+                        # Only cache complete runs; a partial one is retried next upload
+                        if embeddings and len(embeddings) == len(chunks):
+                            store_cached_embeddings(cache_key, chunks, embeddings)
+                    
+                    if chunks and not embeddings:
+                        st.error(f"❌ Could not create embeddings for {uploaded_file.name}; please try again.")
+                    elif chunks:
+                        # One contiguous (N, dim) int8 block plus a scale per row,
+                        # a quarter of the float32 footprint
+                        emb_q8, emb_scale = _build_emb_matrix(uploaded_file.name, file_hash, len(embeddings), embeddings)
+                        
                         # Store in session state
                         st.session_state.documents[uploaded_file.name] = {
                             'chunks': chunks[:len(embeddings)],  # Only keep chunks with embeddings
-                            'embeddings': embeddings,
+                            'emb_q8': emb_q8,
+                            'emb_scale': emb_scale,
+                            'file_hash': file_hash,
                             'company': 'Amazon' if 'amazon' in uploaded_file.name.lower() else 
                                       'Apple' if 'apple' in uploaded_file.name.lower() else 'Company'
                         }
@@ -308,7 +600,8 @@ def main():
                 retrieved = retrieve_relevant_chunks(
                     query,
                     doc_data['chunks'],
-                    doc_data['embeddings'],
+                    doc_data['emb_q8'],
+                    doc_data['emb_scale'],
                     client,
                     top_k=max_chunks
                 )
@@ -318,20 +611,19 @@ def main():
                 # Step 2: Re-rank (optional)
                 if use_reranking:
                     st.markdown("### 🎯 Step 2: Re-Ranking")
-                    reranked = rerank_chunks(query, retrieved, client)
+                    reranked = rerank_chunks(query, retrieved, client, doc_name=selected_doc)
                     st.info(f"Re-ranked {len(reranked)} chunks using semantic scoring")
                     final_chunks = reranked
                 else:
                     final_chunks = retrieved
                 
-                # Step 3: Generate answer
+                # Step 3: Generate answer (streamed into the results below)
                 st.markdown("### 💬 Step 3: Generation")
-                answer = generate_answer(query, final_chunks, client, doc_data['company'])
                 
             # Display results
             st.markdown("---")
             st.markdown("## 📝 Analysis Results")
-            st.markdown(answer)
+            st.write_stream(generate_answer_stream(query, final_chunks, client, doc_data['company']))
             
             # Show sources
             st.markdown("---")
@@ -1,21 +1,49 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import asyncio
+import threading
 from datetime import datetime, timedelta
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Initialize OpenAI client
 @st.cache_resource
 def get_openai_client():
     return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
 
-def llm_call(prompt, system_message="You are a helpful travel planning assistant.", temperature=0.3):
+def llm_call(prompt, system_message="You are a helpful travel planning assistant.", temperature=0.3, json_mode=False):
     """
     Connect to OpenAI API and get response
+    With json_mode=True the model is constrained to a JSON object, which is
+    returned already parsed (the prompt must mention JSON)
     """
     try:
         client = get_openai_client()
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
         response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            **extra
+        )
+        content = response.choices[0].message.content
+        return json.loads(content) if json_mode else content
+    except Exception as e:
+        st.error(f"LLM API Error: {str(e)}")
+        return None
+
+async def async_llm_call(client, prompt, system_message="You are a helpful travel planning assistant.", temperature=0.3):
+    """
+    llm_call for coroutines: same request on an AsyncOpenAI client, so several
+    agents can wait on the API at once
+    """
+    try:
+        response = await client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": system_message},
@@ -28,40 +56,46 @@ def llm_call(prompt, system_message="You are a helpful travel planning assistant
         st.error(f"LLM API Error: {str(e)}")
         return None
 
-def get_weather_data(city, date_str):
+@st.cache_resource
+def _get_http_session():
     """
-    Fetch weather data from OpenWeatherMap API
-    For dates >2 days ahead, use LLM to predict weather
+    One keep-alive session for OpenWeatherMap, shared across reruns; the
+    origin and destination lookups reuse its pooled connections
     """
-    api_key = st.secrets["OPENWEATHERMAP_API_KEY"]
+    s = requests.Session()
+    s.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    s.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return s
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_current_weather(city, _api_key):
+    """
+    Current conditions from OpenWeatherMap, cached for 10 minutes per city;
+    _api_key is not part of the key. Raises on failure so errors aren't cached
+    """
+    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={_api_key}&units=metric"
+    response = _get_http_session().get(url, timeout=5)
     
-    try:
-        # Get current weather data
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-        response = requests.get(url)
-        
-        if response.status_code != 200:
-            return {"error": f"Could not fetch weather for {city}. Please check city name."}
-        
-        data = response.json()
-        
-        # Calculate days difference
-        target_date = datetime.strptime(date_str, "%Y-%m-%d")
-        today = datetime.now()
-        days_diff = (target_date - today).days
-        
-        current_weather = {
-            "city": data["name"],
-            "temperature": data["main"]["temp"],
-            "feels_like": data["main"]["feels_like"],
-            "humidity": data["main"]["humidity"],
-            "description": data["weather"][0]["description"],
-            "wind_speed": data["wind"]["speed"]
-        }
-        
-        # If date is more than 2 days away, use LLM to predict
-        if days_diff > 2:
-            prompt = f"""Based on current weather data for {city}:
+    if response.status_code != 200:
+        raise ValueError(f"Could not fetch weather for {city}. Please check city name.")
+    
+    data = response.json()
+    return {
+        "city": data["name"],
+        "temperature": data["main"]["temp"],
+        "feels_like": data["main"]["feels_like"],
+        "humidity": data["main"]["humidity"],
+        "description": data["weather"][0]["description"],
+        "wind_speed": data["wind"]["speed"]
+    }
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _predict_weather(city, date_str, days_diff, current_weather):
+    """
+    LLM forecast from current conditions, cached per (city, date); raises when
+    the call fails so the fallback isn't cached
+    """
+    prompt = f"""Based on current weather data for {city}:
 Temperature: {current_weather['temperature']}°C
 Humidity: {current_weather['humidity']}%
 Description: {current_weather['description']}
@@ -76,34 +110,49 @@ Return ONLY a JSON object with this exact format:
     "humidity": <predicted humidity %>,
     "conditions": "<overall conditions>"
 }}"""
-            
-            llm_response = llm_call(prompt, temperature=0.3)
-            
-            try:
-                # Extract JSON from response
-                if "```json" in llm_response:
-                    llm_response = llm_response.split("```json")[1].split("```")[0]
-                elif "```" in llm_response:
-                    llm_response = llm_response.split("```")[1].split("```")[0]
-                
-                predicted_weather = json.loads(llm_response.strip())
-                predicted_weather["city"] = city
-                predicted_weather["predicted"] = True
-                return predicted_weather
-            except:
-                # Fallback to current weather if parsing fails
-                current_weather["predicted"] = False
-                return current_weather
-        else:
-            current_weather["predicted"] = False
-            return current_weather
-            
+    
+    predicted_weather = llm_call(prompt, temperature=0.3, json_mode=True)
+    if not isinstance(predicted_weather, dict):
+        raise RuntimeError(f"Weather prediction failed for {city}")
+    predicted_weather["city"] = city
+    predicted_weather["predicted"] = True
+    return predicted_weather
+
+def get_weather_data(city, date_str, api_key):
+    """
+    Fetch weather data from OpenWeatherMap API
+    For dates 3-5 days ahead, current weather stands in as the prediction;
+    beyond that, use LLM to predict weather
+    Returns {"error": ...} on failure; only successful lookups are cached
+    """
+    try:
+        current_weather = _fetch_current_weather(city, api_key)
+        
+        # Calculate days difference
+        target_date = datetime.strptime(date_str, "%Y-%m-%d")
+        today = datetime.now()
+        days_diff = (target_date - today).days
     except Exception as e:
         return {"error": str(e)}
+    
+    # 3-5 days out, current conditions are as good as an LLM paraphrase of them
+    if 2 < days_diff <= 5:
+        return {**current_weather, "predicted": True}
+    
+    # If date is more than 5 days away, use LLM to predict
+    if days_diff > 5:
+        try:
+            return _predict_weather(city, date_str, days_diff, current_weather)
+        except Exception:
+            pass  # Fallback to current weather if the call fails
+    return {**current_weather, "predicted": False}
 
+@st.cache_data(ttl=86400, show_spinner=False)
 def calculate_travel_info(origin, destination):
     """
     Use LLM to estimate distance and travel time
+    Cached for a day per (origin, destination); distances don't change.
+    Raises when the call fails so a failure isn't cached for the day
     """
     prompt = f"""Calculate the approximate travel information between {origin} and {destination}.
 
@@ -124,27 +173,23 @@ Return ONLY a JSON object with this exact format:
     "primary_transport": "<car/flight/train>"
 }}"""
     
-    response = llm_call(prompt, temperature=0.3)
+    response = llm_call(prompt, temperature=0.3, json_mode=True)
     
-    try:
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
-        
-        return json.loads(response.strip())
-    except:
-        # Fallback values
-        return {
-            "distance_km": 500,
-            "distance_miles": 310,
-            "drive_time_hours": 6,
-            "flight_time_hours": 1.5,
-            "is_international": False,
-            "primary_transport": "flight"
-        }
-
-def weather_agent(origin_weather, destination_weather):
+    if not isinstance(response, dict):
+        raise RuntimeError(f"Travel info lookup failed for {origin} -> {destination}")
+    return response
+
+# Used when calculate_travel_info fails
+TRAVEL_INFO_FALLBACK = {
+    "distance_km": 500,
+    "distance_miles": 310,
+    "drive_time_hours": 6,
+    "flight_time_hours": 1.5,
+    "is_international": False,
+    "primary_transport": "flight"
+}
+
+async def weather_agent(client, origin_weather, destination_weather):
     """
     Compare weather at origin and destination
     """
@@ -170,9 +215,9 @@ Provide a concise comparison highlighting:
 
 Keep response under 150 words."""
     
-    return llm_call(prompt)
+    return await async_llm_call(client, prompt)
 
-def logistics_agent(origin, destination, departure_date, duration, travel_info, origin_weather, dest_weather):
+async def logistics_agent(client, origin, destination, departure_date, duration, travel_info, origin_weather, dest_weather):
     """
     Recommend travel mode, timing, and tips
     """
@@ -201,9 +246,9 @@ Provide recommendations for:
 
 Keep response organized and under 200 words."""
     
-    return llm_call(prompt)
+    return await async_llm_call(client, prompt)
 
-def packing_agent(destination_weather, duration, destination):
+async def packing_agent(client, destination_weather, duration, destination):
     """
     Suggest clothing and accessories based on weather and trip length
     """
@@ -223,9 +268,9 @@ Suggest:
 
 Organize by categories. Keep response under 200 words."""
     
-    return llm_call(prompt)
+    return await async_llm_call(client, prompt)
 
-def activity_agent(destination, duration, departure_date, dest_weather):
+async def activity_agent(client, destination, duration, departure_date, dest_weather):
     """
     Create day-wise itinerary with local suggestions
     """
@@ -250,7 +295,39 @@ Day 1 (Date):
 
 Keep each day concise but informative."""
     
-    return llm_call(prompt)
+    return await async_llm_call(client, prompt)
+
+def _in_thread(fn, *args):
+    """Run a blocking call in a worker thread that can still use st.* (e.g. st.error)"""
+    ctx = get_script_run_ctx()
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+    return asyncio.to_thread(run)
+
+async def fetch_all_weather(origin, destination, date_str):
+    """Origin and destination weather, fetched concurrently"""
+    api_key = st.secrets["OPENWEATHERMAP_API_KEY"]
+    return await asyncio.gather(
+        _in_thread(get_weather_data, origin, date_str, api_key),
+        _in_thread(get_weather_data, destination, date_str, api_key),
+    )
+
+async def run_agents(origin, destination, departure_date, duration, travel_info, origin_weather, destination_weather):
+    """
+    Run the four agents concurrently; they only depend on the weather and
+    travel info, not on each other
+    """
+    async with AsyncOpenAI(api_key=st.secrets["OPENAI_API_KEY"]) as client:
+        return await asyncio.gather(
+            weather_agent(client, origin_weather, destination_weather),
+            logistics_agent(
+                client, origin, destination, departure_date,
+                duration, travel_info, origin_weather, destination_weather
+            ),
+            packing_agent(client, destination_weather, duration, destination),
+            activity_agent(client, destination, duration, departure_date, destination_weather),
+        )
 
 # Streamlit App
 def main():
@@ -291,8 +368,9 @@ def main():
             status_text.text("🌤️ Fetching weather data...")
             progress_bar.progress(20)
             
-            origin_weather = get_weather_data(origin, departure_date.strftime("%Y-%m-%d"))
-            destination_weather = get_weather_data(destination, departure_date.strftime("%Y-%m-%d"))
+            origin_weather, destination_weather = asyncio.run(
+                fetch_all_weather(origin, destination, departure_date.strftime("%Y-%m-%d"))
+            )
             
             if "error" in origin_weather or "error" in destination_weather:
                 st.error("Could not fetch weather data. Please check city names and try again.")
@@ -302,30 +380,18 @@ def main():
             status_text.text("🗺️ Calculating travel information...")
             progress_bar.progress(40)
             
-            travel_info = calculate_travel_info(origin, destination)
+            try:
+                travel_info = calculate_travel_info(origin, destination)
+            except Exception:
+                travel_info = dict(TRAVEL_INFO_FALLBACK)
             
-            # Step 3: Run agents
-            status_text.text("🤖 Weather agent analyzing conditions...")
+            # Step 3: Run agents (all four at once)
+            status_text.text("🤖 Weather, logistics, packing and activity agents at work...")
             progress_bar.progress(50)
-            weather_analysis = weather_agent(origin_weather, destination_weather)
-            
-            status_text.text("🚗 Logistics agent planning transportation...")
-            progress_bar.progress(60)
-            logistics_plan = logistics_agent(
-                origin, destination, departure_date.strftime("%Y-%m-%d"), 
+            weather_analysis, logistics_plan, packing_list, itinerary = asyncio.run(run_agents(
+                origin, destination, departure_date.strftime("%Y-%m-%d"),
                 duration, travel_info, origin_weather, destination_weather
-            )
-            
-            status_text.text("🎒 Packing agent preparing your list...")
-            progress_bar.progress(75)
-            packing_list = packing_agent(destination_weather, duration, destination)
-            
-            status_text.text("📅 Activity agent creating your itinerary...")
-            progress_bar.progress(90)
-            itinerary = activity_agent(
-                destination, duration, departure_date.strftime("%Y-%m-%d"), 
-                destination_weather
-            )
+            ))
             
             progress_bar.progress(100)
             status_text.text("✅ Travel plan complete!")
@@ -1,15 +1,24 @@
 """
 Pipeline Orchestrator - Coordinates all components
 Author: Amaan
+
+Weekly runs are scheduled by the OS rather than a long-lived process, e.g.
+  cron:    0 2 * * 0 /usr/bin/python /path/to/orchestrator.py --run-once
+  systemd: a timer unit with OnCalendar=Sun *-*-* 02:00:00 whose service runs
+           /usr/bin/python /path/to/orchestrator.py --run-once
 """
 
+import argparse
+import asyncio
 import json
 import os
+import shutil
+import sys
+import tempfile
 from datetime import datetime
 import logging
-import schedule
-import time
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Tuple
 
 # Import components with error handling
 try:
@@ -20,7 +29,6 @@ try:
 except ImportError as e:
     print(f"Error importing components: {e}")
     print("Make sure all component files are in the same directory.")
-    import sys
     sys.exit(1)
 
 logging.basicConfig(
@@ -29,6 +37,62 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson  # optional: several times faster team_exchange/run-log encoding
+
+    # NON_STR_KEYS keeps json's int-key tolerance; INDENT_2 matches json.dump(indent=2)
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _json_bytes(obj, indent: bool = False) -> bytes:
+        return orjson.dumps(obj, option=_ORJSON_OPTS | orjson.OPT_INDENT_2 if indent else _ORJSON_OPTS)
+except ImportError:
+    def _json_default(obj):
+        if hasattr(obj, "tolist"):  # numpy arrays and scalars
+            return obj.tolist()
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def _json_bytes(obj, indent: bool = False) -> bytes:
+        if indent:
+            return json.dumps(obj, indent=2, default=_json_default).encode()
+        return json.dumps(obj, separators=(",", ":"), default=_json_default).encode()
+
+def _write_files_atomically(outputs: Dict[str, Iterable[bytes]]):
+    """
+    Write every file to a temp dir next to its destination, fsync them all in
+    one pass, then os.replace them into place, so readers never see a partial
+    or mixed set of team_exchange files.
+    """
+    if not outputs:
+        return
+    final_dir = os.path.dirname(os.path.abspath(next(iter(outputs))))
+    tmp_dir = tempfile.mkdtemp(prefix=".writing-", dir=final_dir)
+    try:
+        fds = []
+        try:
+            for i, chunks in enumerate(outputs.values()):
+                fd = os.open(os.path.join(tmp_dir, str(i)), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                fds.append(fd)
+                for chunk in chunks:
+                    view = memoryview(chunk)
+                    while view:
+                        view = view[os.write(fd, view):]
+            for fd in fds:  # deferred until every write has been issued
+                os.fsync(fd)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        for i, path in enumerate(outputs):
+            os.replace(os.path.join(tmp_dir, str(i)), path)
+        dir_fd = os.open(final_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)  # persist the renames
+        finally:
+            os.close(dir_fd)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
 class PipelineOrchestrator:
     """Coordinates the entire data pipeline"""
     
@@ -57,50 +121,65 @@ class PipelineOrchestrator:
         logger.info("="*60)
         
         start_time = datetime.now()
+        os.makedirs("./data/pipeline_runs", exist_ok=True)
+        run_id = start_time.strftime("%Y%m%d_%H%M%S")
+        steps_path = f"./data/pipeline_runs/run_{run_id}.ndjson"
         results = {
             'start_time': start_time.isoformat(),
-            'steps': {}
+            'steps_log': steps_path,
+            'steps_completed': []
         }
         
-        try:
-            # Step 1: Fetch new papers
-            logger.info("Step 1: Fetching papers from arXiv...")
-            fetch_results = self.arxiv_bot.fetch_recent_papers(
-                days_back=self.config['days_back'],
-                max_results=self.config['max_papers_per_run']
-            )
-            results['steps']['fetch'] = fetch_results
-            logger.info(f"✓ Fetched {fetch_results['papers_stored']} papers")
-            
-            # Step 2: Parse PDFs
-            logger.info("Step 2: Parsing PDF documents...")
-            parse_results = self.pdf_parser.parse_all_unprocessed()
-            results['steps']['parse'] = parse_results
-            logger.info(f"✓ Parsed {parse_results['success']} papers")
-            
-            # Step 3: Create embeddings
-            logger.info("Step 3: Creating embeddings...")
-            embedding_results = self.vector_store.process_all_papers()
-            results['steps']['embeddings'] = embedding_results
-            logger.info(f"✓ Created embeddings for {embedding_results['success']} papers")
-            
-            # Step 4: Prepare data for team
-            logger.info("Step 4: Preparing data for team...")
-            team_results = self.prepare_team_data()
-            results['steps']['team_data'] = team_results
-            logger.info(f"✓ Prepared data for team")
+        # Step outputs go to disk as they finish (one JSON object per line)
+        # instead of piling up in `results`; read back with
+        # `for line in f: json.loads(line)`.
+        with open(steps_path, 'wb') as steps_log:
+            def record_step(name: str, step_result):
+                steps_log.write(_json_bytes({'step': name, 'result': step_result}))
+                steps_log.write(b"\n")
+                steps_log.flush()
+                results['steps_completed'].append(name)
             
-            results['status'] = 'SUCCESS'
-            
-        except Exception as e:
-            logger.error(f"Pipeline failed: {e}")
-            results['status'] = 'FAILED'
-            results['error'] = str(e)
-        
-        results['end_time'] = datetime.now().isoformat()
-        
-        # Save pipeline results
-        self._save_results(results)
+            try:
+                # Step 1: Fetch new papers
+                logger.info("Step 1: Fetching papers from arXiv...")
+                fetch_results = self.arxiv_bot.fetch_recent_papers(
+                    days_back=self.config['days_back'],
+                    max_results=self.config['max_papers_per_run']
+                )
+                record_step('fetch', fetch_results)
+                logger.info(f"✓ Fetched {fetch_results['papers_stored']} papers")
+                
+                # Step 2: Parse PDFs
+                logger.info("Step 2: Parsing PDF documents...")
+                parse_results = self.pdf_parser.parse_all_unprocessed()
+                record_step('parse', parse_results)
+                logger.info(f"✓ Parsed {parse_results['success']} papers")
+                
+                # Steps 3 + 4: embeddings and team data both only need the parsed
+                # papers, so run them side by side (WAL allows the concurrent reads)
+                logger.info("Step 3: Creating embeddings...")
+                logger.info("Step 4: Preparing data for team...")
+                embedding_results, team_results = asyncio.run(self._embed_and_prepare_team_data())
+                record_step('embeddings', embedding_results)
+                logger.info(f"✓ Created embeddings for {embedding_results['success']} papers")
+                record_step('team_data', team_results)
+                logger.info(f"✓ Prepared data for team")
+                self.db.analyze()  # refresh planner stats after the bulk load
+                
+                results['status'] = 'SUCCESS'
+                
+            except Exception as e:
+                logger.error(f"Pipeline failed: {e}")
+                results['status'] = 'FAILED'
+                results['error'] = str(e)
+        
+        end_time = datetime.now()
+        results['end_time'] = end_time.isoformat()
+        results['duration_sec'] = (end_time - start_time).total_seconds()
+        
+        # Save pipeline summary (status, timings); step details are in steps_log
+        self._save_results(results, run_id)
         
         logger.info("="*60)
         logger.info(f"PIPELINE COMPLETE - Status: {results['status']}")
@@ -108,81 +187,95 @@ class PipelineOrchestrator:
         
         return results
     
+    async def _embed_and_prepare_team_data(self) -> Tuple[Dict, Dict]:
+        """Run embedding creation and team data export concurrently on worker threads"""
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            embedding_results, team_results = await asyncio.gather(
+                loop.run_in_executor(pool, self.vector_store.process_all_papers),
+                loop.run_in_executor(pool, self.prepare_team_data),
+            )
+        return embedding_results, team_results
+    
     def prepare_team_data(self) -> Dict:
         """Prepare data for team members"""
+        # Embeddings may be written concurrently (see _embed_and_prepare_team_data);
+        # one read snapshot keeps each file's counts in line with its rows
+        with self.db.read_snapshot():
+            return self._prepare_team_data()
+    
+    def _prepare_team_data(self) -> Dict:
         team_results = {}
+        outputs = {}  # final path -> byte chunks, written together at the end
         
         # For Nikita - Papers needing summarization
-        papers_for_nikita = self.db.get_papers_for_summarization()
+        # Streamed one paper at a time so full_text never piles up in memory
+        nikita_count = self.db.count_papers_for_summarization()
         
-        if papers_for_nikita:
-            nikita_data = {
-                "metadata": {
-                    "created_at": datetime.now().isoformat(),
-                    "total_papers": len(papers_for_nikita)
-                },
-                "papers": []
+        if nikita_count:
+            nikita_metadata = {
+                "created_at": datetime.now().isoformat(),
+                "total_papers": nikita_count
             }
             
-            for paper in papers_for_nikita:
-                nikita_data["papers"].append({
-                    "arxiv_id": paper['arxiv_id'],
-                    "title": paper['title'],
-                    "abstract": paper['abstract'],
-                    "authors": paper['authors'],
-                    "full_text": paper.get('full_text', ''),
-                    "sections": paper.get('sections', {}),
-                    "for_summarization": True
-                })
-            
             # Save to JSON for Nikita
-            with open("./data/team_exchange/for_nikita_summarization.json", 'w') as f:
-                json.dump(nikita_data, f, indent=2)
+            outputs["./data/team_exchange/for_nikita_summarization.json"] = \
+                self._stream_nikita_papers(nikita_metadata)
             
-            team_results['nikita'] = len(papers_for_nikita)
-            logger.info(f"Prepared {len(papers_for_nikita)} papers for Nikita")
+            team_results['nikita'] = nikita_count
+            logger.info(f"Prepared {nikita_count} papers for Nikita")
         
         # For Arun - Papers with metadata for knowledge graph
-        self.db.cursor.execute("""
-        SELECT arxiv_id, title, abstract, authors, categories, published_date
-        FROM papers
-        WHERE processed = 1
-        ORDER BY published_date DESC
-        LIMIT 50
-        """)
-        
-        arun_papers = []
-        for row in self.db.cursor.fetchall():
-            paper = dict(row)
-            paper['authors'] = json.loads(paper['authors']) if paper['authors'] else []
-            paper['categories'] = json.loads(paper['categories']) if paper['categories'] else []
-            arun_papers.append(paper)
+        # SQLite builds the papers array itself; Python only receives one JSON string.
+        # A plain aggregate may see rows in any order, so json_group_array runs as
+        # a window function over the full frame: the window ORDER BY fixes the
+        # array order (every output row carries the same array; keep the first)
+        row = self.db.cursor.execute("""
+        SELECT COUNT(*) OVER win, json_group_array(json_object(
+            'arxiv_id', arxiv_id,
+            'title', title,
+            'abstract', abstract,
+            'authors', CASE WHEN json_valid(authors) THEN json(authors) ELSE json('[]') END,
+            'categories', CASE WHEN json_valid(categories) THEN json(categories) ELSE json('[]') END,
+            'published_date', published_date
+        )) OVER win
+        FROM (
+            SELECT arxiv_id, title, abstract, authors, categories, published_date
+            FROM papers
+            WHERE processed = 1
+            ORDER BY published_date DESC, arxiv_id
+            LIMIT 50
+        )
+        WINDOW win AS (
+            ORDER BY published_date DESC, arxiv_id
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+        LIMIT 1
+        """).fetchone()
+        arun_count, arun_papers_json = row if row is not None else (0, '[]')
         
-        if arun_papers:
-            arun_data = {
-                "metadata": {
-                    "created_at": datetime.now().isoformat(),
-                    "total_papers": len(arun_papers)
-                },
-                "papers": arun_papers
+        if arun_count:
+            arun_metadata = {
+                "created_at": datetime.now().isoformat(),
+                "total_papers": arun_count
             }
             
-            with open("./data/team_exchange/for_arun_knowledge_graph.json", 'w') as f:
-                json.dump(arun_data, f, indent=2)
+            outputs["./data/team_exchange/for_arun_knowledge_graph.json"] = [
+                b'{\n  "metadata": ', _json_bytes(arun_metadata),
+                b',\n  "papers": ', arun_papers_json.encode(), b'\n}'
+            ]
             
-            team_results['arun'] = len(arun_papers)
-            logger.info(f"Prepared {len(arun_papers)} papers for Arun")
+            team_results['arun'] = arun_count
+            logger.info(f"Prepared {arun_count} papers for Arun")
         
-        # For Elana - Latest papers for UI
-        self.db.cursor.execute("""
+        # For Elana - Latest papers for UI (rows are sqlite3.Row; iterate the cursor directly)
+        elana_papers = [dict(row) for row in self.db.cursor.execute("""
         SELECT arxiv_id, title, abstract, published_date
         FROM papers
         WHERE processed = 1
         ORDER BY published_date DESC
         LIMIT 20
-        """)
-        
-        elana_papers = [dict(row) for row in self.db.cursor.fetchall()]
+        """)]
         
         if elana_papers:
             elana_data = {
@@ -191,14 +284,33 @@ class PipelineOrchestrator:
                 "stats": self.db.get_stats()
             }
             
-            with open("./data/team_exchange/for_elana_ui.json", 'w') as f:
-                json.dump(elana_data, f, indent=2)
+            outputs["./data/team_exchange/for_elana_ui.json"] = [
+                _json_bytes(elana_data, indent=True)
+            ]
             
             team_results['elana'] = len(elana_papers)
             logger.info(f"Prepared {len(elana_papers)} papers for Elana")
         
+        _write_files_atomically(outputs)
         return team_results
     
+    def _stream_nikita_papers(self, metadata: Dict) -> Iterator[bytes]:
+        """Yield Nikita's JSON file in pieces, encoding each paper as it is read"""
+        yield b'{\n  "metadata": ' + _json_bytes(metadata) + b',\n  "papers": ['
+        sep = b'\n    '
+        for paper in self.db.iter_papers_for_summarization():
+            yield sep + _json_bytes({
+                "arxiv_id": paper['arxiv_id'],
+                "title": paper['title'],
+                "abstract": paper['abstract'],
+                "authors": paper['authors'],
+                "full_text": paper['full_text'],
+                "sections": paper['sections'],
+                "for_summarization": True
+            })
+            sep = b',\n    '
+        yield b'\n  ]\n}'
+    
     def search_papers(self, query: str) -> Dict:
         """Search papers using vector similarity"""
         results = self.vector_store.semantic_search(query, n_results=5)
@@ -210,56 +322,73 @@ class PipelineOrchestrator:
         }
     
     def schedule_weekly_run(self):
-        """Schedule pipeline to run weekly"""
-        # Schedule for every Sunday at 2 AM
-        schedule.every().sunday.at("02:00").do(self.run_complete_pipeline)
-        
-        logger.info("Pipeline scheduled for weekly runs (Sundays at 2 AM)")
-        
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        """Print how to schedule weekly runs (Sundays at 2 AM) with cron or systemd"""
+        script = os.path.abspath(__file__)
+        print("\nAdd this line with `crontab -e`:")
+        print(f"  0 2 * * 0 {sys.executable} {script} --run-once")
+        print("\nor use a systemd timer with:")
+        print("  OnCalendar=Sun *-*-* 02:00:00")
+        print(f"  ExecStart={sys.executable} {script} --run-once")
     
     def get_status(self) -> Dict:
         """Get current pipeline status"""
-        stats = self.db.get_stats()
-        
-        # Get last run info
-        self.db.cursor.execute("""
-        SELECT start_time, end_time, status, papers_fetched, papers_processed
-        FROM pipeline_runs
-        ORDER BY id DESC
-        LIMIT 1
-        """)
-        
-        last_run = self.db.cursor.fetchone()
-        
-        if last_run:
+        # Paper counts and the last run in one statement; LEFT JOIN keeps the
+        # stats row when no run has been logged yet
+        row = self.db.cursor.execute("""
+        WITH stats AS (
+            SELECT COUNT(*) AS total_papers,
+                   COALESCE(SUM(processed), 0) AS processed_papers,
+                   COALESCE(SUM(embedding_created), 0) AS papers_with_embeddings
+            FROM papers
+        ), last AS (
+            SELECT start_time, end_time, status, papers_fetched, papers_processed
+            FROM pipeline_runs
+            ORDER BY id DESC
+            LIMIT 1
+        )
+        SELECT * FROM stats LEFT JOIN last ON 1
+        """).fetchone()
+        
+        stats = {
+            'total_papers': row['total_papers'],
+            'processed_papers': row['processed_papers'],
+            'papers_with_embeddings': row['papers_with_embeddings'],
+        }
+        if row['status'] is not None:
             stats['last_run'] = {
-                'start_time': last_run[0],
-                'end_time': last_run[1],
-                'status': last_run[2],
-                'papers_fetched': last_run[3],
-                'papers_processed': last_run[4]
+                'start_time': row['start_time'],
+                'end_time': row['end_time'],
+                'status': row['status'],
+                'papers_fetched': row['papers_fetched'],
+                'papers_processed': row['papers_processed']
             }
         else:
             stats['last_run'] = None
         
         return stats
     
-    def _save_results(self, results: Dict):
-        """Save pipeline results to file"""
+    def _save_results(self, results: Dict, run_id: str = None):
+        """Save the pipeline run summary to file"""
         os.makedirs("./data/pipeline_runs", exist_ok=True)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
         filepath = f"./data/pipeline_runs/run_{timestamp}.json"
         
-        with open(filepath, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(_json_bytes(results, indent=True))
 
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="RAG Research Bot pipeline manager")
+    parser.add_argument("--run-once", action="store_true",
+                        help="run the complete pipeline once and exit (for cron/systemd)")
+    args = parser.parse_args()
+    
+    if args.run_once:
+        results = PipelineOrchestrator().run_complete_pipeline()
+        sys.exit(0 if results['status'] == 'SUCCESS' else 1)
+    
     print("""
     ╔═══════════════════════════════════════╗
     ║   RAG Research Bot Pipeline Manager   ║
@@ -272,7 +401,7 @@ def main():
     print("1. Run complete pipeline")
     print("2. Check pipeline status")
     print("3. Search papers")
-    print("4. Schedule weekly runs")
+    print("4. Show how to schedule weekly runs")
     print("5. Exit")
     
     choice = input("\nEnter choice (1-5): ")
@@ -304,7 +433,6 @@ def main():
             print(f"   {paper['abstract']}")
     
     elif choice == "4":
-        print("\nStarting scheduler... (Press Ctrl+C to stop)")
         orchestrator.schedule_weekly_run()
     
     elif choice == "5":
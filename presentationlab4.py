@@ -3,16 +3,35 @@
 # -----------------------------------------------------
 # Prereqs:
 #   pip install streamlit openai
+#   (optional) pip install sentence-transformers   # enables the semantic cache
+#   (optional) pip install hnswlib                 # ANN lookups for a large cache
 # Secrets:
 #   Put OPENAI_API_KEY in .streamlit/secrets.toml or your environment.
 
 import os
+import re
+import copy
 import json
 import time
+from collections import deque
+from itertools import islice
 from typing import Dict, Any, List, Tuple
 
 import streamlit as st
 from openai import OpenAI
+try:
+    import orjson  # optional: faster parsing of the model's JSON verdict
+    _json_loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+from utils.semantic_cache import SemanticCache
 
 # ================================
 # Page setup & keys
@@ -25,11 +44,17 @@ OPENAI_KEY = st.secrets.get("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", ""))
 if not OPENAI_KEY:
     st.warning("Set your OPENAI_API_KEY in .streamlit/secrets.toml or environment.")
 
-client = OpenAI(api_key=OPENAI_KEY)
+@st.cache_resource
+def get_client() -> OpenAI:
+    """One OpenAI client (and its HTTPS connection pool) shared across reruns and sessions."""
+    return OpenAI(api_key=OPENAI_KEY)
 
 # ================================
 # Helpers
 # ================================
+# Server-side prompt cache id for SYSTEM_PROMPT: bump the version on any prompt edit
+PROMPT_CACHE_KEY = "fact_checker_v1"
+
 SYSTEM_PROMPT = """You are an evidence-based fact-checking assistant.
 Your job: verify a single factual claim using live search, then return a STRICT JSON object with NO additional text before or after.
 
@@ -58,14 +83,15 @@ Rules:
 """
 
 
+_md_link = "[{0}]({1})".format  # bound once, reused for every source
+
+def _source_link(s: Dict[str, Any]) -> str:
+    title = (s.get("title") or "Source").strip()
+    url = (s.get("url") or "").strip()
+    return _md_link(title, url) if url else title
+
 def _mk_clickable_sources(sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out = []
-    for s in sources:
-        title = (s.get("title") or "Source").strip()
-        url = (s.get("url") or "").strip()
-        link = f"[{title}]({url})" if url else title
-        out.append({**s, "link": link})
-    return out
+    return [{**s, "link": _source_link(s)} for s in sources]
 
 def _basic_confidence_hint(sources: List[Dict[str, Any]]) -> str:
     n = len(sources or [])
@@ -73,39 +99,87 @@ def _basic_confidence_hint(sources: List[Dict[str, Any]]) -> str:
     if n == 3: return "Medium: several sources."
     return "Low: limited sourcing."
 
-def fact_check_claim(user_claim: str) -> Tuple[Dict[str, Any], str]:
-    """Call OpenAI /v1/responses with web_search tool. Returns (parsed_json, raw_text)."""
+# ================================
+# Semantic cache
+# ================================
+# Near-duplicate claims ("Dark chocolate is healthy." / "Is dark chocolate healthy?")
+# reuse the earlier verdict instead of another web_search call.
+CACHE_SIMILARITY = 0.92
+CACHE_TTL_SEC = 24 * 3600
+CACHE_MAX_ITEMS = 100_000  # past ~10k entries lookups move to an HNSW index
+
+@st.cache_resource
+def get_embedder():
+    """Small local sentence embedder, or None when sentence-transformers isn't installed."""
+    if SentenceTransformer is None:
+        return None
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+@st.cache_resource
+def get_claim_cache() -> SemanticCache:
+    return SemanticCache(threshold=CACHE_SIMILARITY, max_items=CACHE_MAX_ITEMS, ttl_sec=CACHE_TTL_SEC)
+
+MIN_CLAIM_CHARS = 8
+MAX_CLAIM_CHARS = 2000  # longer input is truncated rather than refused by the model
+_WORD_RE = re.compile(r"[A-Za-z]{3,}")
+
+def _normalize_claim(claim: str) -> str:
+    return re.sub(r"\s+", " ", claim).strip().lower().rstrip(".?!")
+
+def fact_check_claim(user_claim: str, check_cache: bool = True) -> Tuple[Dict[str, Any], str]:
+    """
+    Call OpenAI /v1/responses with web_search tool. Returns (parsed_json, raw_text).
+    A semantically similar earlier claim is answered from the cache; pass
+    check_cache=False to always verify live (nothing is read or stored).
+    """
     if not user_claim or not user_claim.strip():
         raise ValueError("Please provide a non-empty claim.")
 
+    # Reject input the model can't usefully check before paying for a round-trip
+    claim = user_claim.strip()
+    if len(claim) < MIN_CLAIM_CHARS:
+        raise ValueError(f"Claim is too short; please write at least {MIN_CLAIM_CHARS} characters.")
+    if not _WORD_RE.search(claim):
+        raise ValueError("Claim must contain words.")
+    claim = claim[:MAX_CLAIM_CHARS]
+
+    embedder = get_embedder() if check_cache else None
+    if embedder is not None:
+        claim_vec = embedder.encode(_normalize_claim(claim), normalize_embeddings=True)
+        hit = get_claim_cache().get(claim_vec)
+        if hit is not None:
+            # Callers decorate the dict in place, so never hand out the cached one
+            return copy.deepcopy(hit)
+
+    parsed, raw_text = _fact_check_claim_live(claim)
+    if embedder is not None:
+        get_claim_cache().set(claim_vec, copy.deepcopy((parsed, raw_text)))
+    return parsed, raw_text
+
+def _fact_check_claim_live(claim: str) -> Tuple[Dict[str, Any], str]:
+    """The uncached Responses API call behind fact_check_claim."""
+    client = get_client()
     resp = client.responses.create(
         model="gpt-4.1-mini",  # or "gpt-4.1" / "gpt-4o-mini"
         input=[
             {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_claim.strip()},
+            {"role": "user", "content": claim},
         ],
         tools=[
             {"type": "web_search"}
         ],
         temperature=0.2,
+        prompt_cache_key=PROMPT_CACHE_KEY,
     )
 
-    # Parse the response
-    raw_text = ""
+    # Parse the response: the SDK's output_text, else join every output_text part
     try:
-        # Try to get output_text first
-        if hasattr(resp, "output_text") and resp.output_text:
-            raw_text = resp.output_text
-        # Try output.content structure
-        elif hasattr(resp, "output") and resp.output:
-            if hasattr(resp.output, "content"):
-                for c in resp.output.content:
-                    if hasattr(c, "type") and c.type == "output_text" and hasattr(c, "text"):
-                        raw_text += c.text
-            # Fallback to direct access
-            elif isinstance(resp.output, list) and len(resp.output) > 0:
-                if hasattr(resp.output[0], "content") and len(resp.output[0].content) > 0:
-                    raw_text = resp.output[0].content[0].text
+        raw_text = getattr(resp, "output_text", None) or "".join([
+            c.text
+            for item in (getattr(resp, "output", None) or [])
+            for c in (getattr(item, "content", None) or [])
+            if getattr(c, "type", None) == "output_text"
+        ])
     except Exception as e:
         raise RuntimeError(f"Could not extract response: {e}")
 
@@ -122,17 +196,21 @@ def fact_check_claim(user_claim: str) -> Tuple[Dict[str, Any], str]:
         raw_text = raw_text[:-3]
     raw_text = raw_text.strip()
 
-    # Parse JSON (with salvage fallback)
-    try:
-        parsed = json.loads(raw_text)
-    except json.JSONDecodeError:
+    # Parse JSON: a bare {...} object is the normal case; salvage only otherwise
+    parsed = None
+    if raw_text[:1] == "{" and raw_text[-1:] == "}":
+        try:
+            parsed = _json_loads(raw_text)
+        except JSONDecodeError:
+            pass
+    if parsed is None:
         # Try to find JSON object in the text
         start = raw_text.find("{")
         end = raw_text.rfind("}") + 1
         if start >= 0 and end > start:
             try:
-                parsed = json.loads(raw_text[start:end])
-            except json.JSONDecodeError as e:
+                parsed = _json_loads(raw_text[start:end])
+            except JSONDecodeError as e:
                 raise RuntimeError(f"Could not parse JSON from response: {e}\nRaw text: {raw_text}")
         else:
             raise RuntimeError(f"No JSON object found in response.\nRaw text: {raw_text}")
@@ -148,8 +226,10 @@ def fact_check_claim(user_claim: str) -> Tuple[Dict[str, Any], str]:
 # ================================
 # Session state
 # ================================
+FC_HISTORY_MAX = 50
 if "fc_history" not in st.session_state:
-    st.session_state.fc_history = []  # {claim, verdict, confidence, time, sources, obj}
+    # Newest first; bounded so long sessions don't keep every result around
+    st.session_state.fc_history = deque(maxlen=FC_HISTORY_MAX)  # {claim, verdict, confidence, time, sources, obj}
 
 # ================================
 # UI — Input
@@ -177,7 +257,7 @@ if go:
             try:
                 result_obj, _ = fact_check_claim(st.session_state.user_claim_value)
                 result_obj["sources"] = _mk_clickable_sources(result_obj.get("sources", []))
-                st.session_state.fc_history.insert(0, {
+                st.session_state.fc_history.appendleft({
                     "claim": result_obj.get("claim", st.session_state.user_claim_value),
                     "verdict": result_obj.get("verdict", "Uncertain"),
                     "confidence": float(result_obj.get("confidence", 0)),
@@ -215,7 +295,7 @@ st.markdown("### History")
 if not st.session_state.fc_history:
     st.caption("No checks yet. Try one of the samples below.")
 else:
-    for item in st.session_state.fc_history[:5]:
+    for item in islice(st.session_state.fc_history, 5):
         st.markdown(f"- **{item['claim']}** → `{item['verdict']}` · conf `{item['confidence']:.2f}` · _{item['time']}_")
 
 # ================================
@@ -0,0 +1,50 @@
+"""
+PyMuPDF (fitz) text extraction shared by the PDF labs: short documents are
+read in one pass, long ones as contiguous page ranges in worker processes.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+MAX_PAGE_WORKERS = 8
+
+
+def _pages_text(doc, start: int, stop: int) -> str:
+    buf = io.StringIO()
+    for i in range(start, stop):
+        buf.write(doc.load_page(i).get_text("text"))
+        buf.write("\n")
+    return buf.getvalue()
+
+
+def fitz_page_range_text(data: bytes, start: int, stop: int) -> str:
+    """Extract pages [start, stop) from a document opened in this process."""
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return _pages_text(doc, start, stop)
+
+
+def fitz_pdf_text(data: bytes, parallel_threshold: int) -> str:
+    """
+    Text of every page, one per line block. Documents with at least
+    `parallel_threshold` pages are split into contiguous page ranges, each
+    parsed by a worker process that opens its own copy from `data`. PyMuPDF is
+    not thread-safe (and holds the GIL), so processes are the only way to
+    parse pages in parallel. Raises ImportError when PyMuPDF isn't installed.
+    """
+    if fitz is None:
+        raise ImportError("PyMuPDF (fitz) is not installed")
+    workers = min(MAX_PAGE_WORKERS, os.cpu_count() or 1)
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        n = doc.page_count
+        if n < parallel_threshold or workers < 2:
+            return _pages_text(doc, 0, n)
+    step = -(-n // workers)
+    starts = range(0, n, step)
+    stops = [min(i + step, n) for i in starts]
+    with ProcessPoolExecutor(max_workers=len(stops)) as ex:
+        return "".join(ex.map(fitz_page_range_text, [data] * len(stops), starts, stops))
@@ -0,0 +1,132 @@
+"""
+In-memory semantic cache: looks values up by embedding similarity instead of
+exact key, with the same TTL + LRU bounds as TTLCache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib  # optional: ANN lookups once the cache is large
+except ImportError:
+    hnswlib = None
+
+# Below this many entries a flat matrix-vector product beats index upkeep
+ANN_MIN_ITEMS = 10_000
+HNSW_EF_CONSTRUCTION = 200
+HNSW_M = 16
+HNSW_EF_SEARCH = 50
+
+
+class SemanticCache:
+    """
+    Stores (vector, value) pairs and returns the value whose vector has cosine
+    similarity >= `threshold` with the query. Vectors are L2-normalized on the
+    way in. Lookups are a flat matrix-vector product, switching to an HNSW
+    index (when hnswlib is installed) once `ann_min_items` entries are held.
+    At most `max_items` entries are kept (least recently used are evicted
+    first) and each expires `ttl_sec` seconds after it was stored. Safe to
+    share between threads.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_items: int = 1024, ttl_sec: float = 86400,
+                 ann_min_items: int = ANN_MIN_ITEMS):
+        self.threshold = threshold
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        self.ann_min_items = ann_min_items
+        self._entries: Dict[int, Tuple[np.ndarray, Any]] = {}
+        self._expiry: "OrderedDict[int, float]" = OrderedDict()  # insertion == expiry order
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._next_id = 0
+        self._dim: Optional[int] = None
+        self._matrix: Optional[Tuple[np.ndarray, np.ndarray]] = None  # (ids, (N, d) vectors)
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32).ravel()
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def _remove(self, entry_id: int) -> None:
+        del self._entries[entry_id]
+        self._expiry.pop(entry_id, None)
+        self._lru.pop(entry_id, None)
+        self._matrix = None
+        if self._index is not None:
+            self._index.mark_deleted(entry_id)
+
+    def _purge_expired(self, now: float) -> None:
+        while self._expiry:
+            entry_id, expires_at = next(iter(self._expiry.items()))
+            if expires_at >= now:
+                break
+            self._remove(entry_id)
+
+    def _build_index(self) -> None:
+        index = hnswlib.Index(space="cosine", dim=self._dim)
+        index.init_index(max_elements=self.max_items, ef_construction=HNSW_EF_CONSTRUCTION,
+                         M=HNSW_M, allow_replace_deleted=True)
+        index.set_ef(HNSW_EF_SEARCH)
+        ids = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+        index.add_items(np.stack([vec for vec, _ in self._entries.values()]), ids)
+        self._index = index
+
+    def _nearest(self, q: np.ndarray) -> Tuple[int, float]:
+        """(entry id, cosine similarity) of the closest stored vector."""
+        if self._index is not None:
+            labels, dists = self._index.knn_query(q, k=1)
+            return int(labels[0][0]), 1.0 - float(dists[0][0])
+        if self._matrix is None:
+            ids = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            self._matrix = (ids, np.stack([vec for vec, _ in self._entries.values()]))
+        ids, vecs = self._matrix
+        sims = vecs @ q
+        best = int(np.argmax(sims))
+        return int(ids[best]), float(sims[best])
+
+    def get(self, vec) -> Optional[Any]:
+        """Return the closest cached value if it is similar enough, else None."""
+        q = self._unit(vec)
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            if not self._entries or q.shape[0] != self._dim:
+                return None
+            entry_id, sim = self._nearest(q)
+            if sim < self.threshold:
+                return None
+            self._lru.move_to_end(entry_id)
+            return self._entries[entry_id][1]
+
+    def set(self, vec, value: Any) -> None:
+        q = self._unit(vec)
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            if q.shape[0] != self._dim:
+                # A different embedder: earlier vectors are not comparable
+                self._entries.clear()
+                self._expiry.clear()
+                self._lru.clear()
+                self._matrix = self._index = None
+                self._dim = q.shape[0]
+            while len(self._entries) >= self.max_items:
+                self._remove(next(iter(self._lru)))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (q, value)
+            self._expiry[entry_id] = time.monotonic() + self.ttl_sec
+            self._lru[entry_id] = None
+            self._matrix = None
+            if self._index is not None:
+                self._index.add_items(q[None, :], np.array([entry_id]), replace_deleted=True)
+            elif hnswlib is not None and len(self._entries) >= self.ann_min_items:
+                self._build_index()
+
+    def __len__(self) -> int:
+        return len(self._entries)
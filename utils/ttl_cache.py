@@ -0,0 +1,44 @@
+"""
+Small in-memory LRU cache whose entries also expire after a fixed TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Maps keys to values for at most `ttl_sec` seconds, keeping at most
+    `max_items` entries (least recently used are evicted first).
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_items: int = 2048, ttl_sec: float = 900):
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_sec, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)